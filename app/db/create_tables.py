@@ -1,4 +1,6 @@
 # app/db/create_tables.py
+import argparse
+import psycopg2
 from app.db.connection import conn
 
 def create_audit_tables():
@@ -34,3 +36,78 @@ def create_audit_tables():
             current_hash TEXT
         );
         """)
+
+def create_extraction_tables():
+    with conn.cursor() as cur:
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS chunk_extractions (
+            text_hash TEXT PRIMARY KEY,
+            extractor_version INT NOT NULL,
+            extraction JSONB NOT NULL,
+            updated_at TIMESTAMP DEFAULT NOW()
+        );
+        """)
+
+def create_search_indexes():
+    """
+    Hybrid-search migration, run explicitly (python -m app.db.create_tables
+    --search-indexes), never at startup: adding the stored chunk_tsv column
+    rewrites document_chunks once; the indexes are built CONCURRENTLY so
+    reads and ingest keep running. Until it has run, hybrid /search and /rag
+    fall back to vector-only (retrieval.lexical_index_ready).
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('document_chunks') IS NOT NULL;")
+        if not cur.fetchone()[0]:
+            raise RuntimeError("document_chunks does not exist yet; create it before adding search indexes")
+        # Full-text side of hybrid retrieval: a stored tsvector, so ranking reads
+        # it instead of re-parsing chunk_text per candidate (see retrieval.py)
+        cur.execute("""
+        ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS chunk_tsv tsvector
+        GENERATED ALWAYS AS (to_tsvector('english', coalesce(chunk_text, ''))) STORED;
+        """)
+        _create_index_concurrently(cur, "document_chunks_tsv_idx", "document_chunks USING GIN (chunk_tsv)")
+        cur.execute("DROP INDEX CONCURRENTLY IF EXISTS document_chunks_fts_idx;")
+        # ANN side (L2, matching the <-> operator used by /search and /rag); optional,
+        # since older pgvector releases have no HNSW
+        try:
+            _create_index_concurrently(cur, "document_chunks_embedding_hnsw_idx",
+                                       "document_chunks USING hnsw (embedding vector_l2_ops)")
+        except psycopg2.Error as e:
+            print(f"⚠️ HNSW index not created ({e.pgerror or e}); vector search stays on a sequential scan")
+
+def _create_index_concurrently(cur, name, target):
+    try:
+        cur.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {target};")
+    except psycopg2.Error:
+        # A failed concurrent build leaves an INVALID index that IF NOT EXISTS would skip next time
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name};")
+        raise
+
+# Serializes schema setup when several API workers start at once
+SCHEMA_LOCK_ID = 7301
+
+def create_all_tables():
+    """
+    Idempotent setup of the small tables the API needs, run at API startup
+    (or: python -m app.db.create_tables). Search indexes are a separate step.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(%s);", (SCHEMA_LOCK_ID,))
+    try:
+        create_audit_tables()
+        create_extraction_tables()
+    finally:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_unlock(%s);", (SCHEMA_LOCK_ID,))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create tables (and, on request, the hybrid-search indexes)")
+    parser.add_argument("--search-indexes", action="store_true",
+                        help="add chunk_tsv to document_chunks and build its GIN / HNSW indexes concurrently")
+    args = parser.parse_args()
+    create_all_tables()
+    print("✅ Tables ready")
+    if args.search_indexes:
+        create_search_indexes()
+        print("✅ Search indexes ready")
@@ -0,0 +1,107 @@
+# app/db/extractions.py
+import argparse
+import hashlib
+import json
+from psycopg2.extras import execute_values
+from app.db.connection import conn
+from app.utils.dead import extract_entities_and_deadlines_batch, EXTRACTOR_VERSION
+
+# -------------------------
+# Persisted entity/deadline extraction, keyed by text_hash
+# -------------------------
+def store_chunk_extractions(items):
+    """
+    items: list of (text_hash, extraction dict). Upserts under the current EXTRACTOR_VERSION.
+    """
+    if not items:
+        return
+    with conn.cursor() as cur:
+        execute_values(cur, """
+            INSERT INTO chunk_extractions (text_hash, extractor_version, extraction)
+            VALUES %s
+            ON CONFLICT (text_hash) DO UPDATE
+            SET extractor_version = EXCLUDED.extractor_version,
+                extraction = EXCLUDED.extraction,
+                updated_at = NOW()
+        """, [(h, EXTRACTOR_VERSION, json.dumps(e)) for h, e in items])
+
+
+def get_chunk_extractions(text_hashes):
+    """
+    Returns {text_hash: extraction} for hashes stored with the current EXTRACTOR_VERSION.
+    """
+    if not text_hashes:
+        return {}
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT text_hash, extraction
+            FROM chunk_extractions
+            WHERE text_hash = ANY(%s) AND extractor_version = %s
+        """, (list(text_hashes), EXTRACTOR_VERSION))
+        return {r[0]: r[1] for r in cur.fetchall()}
+
+
+def get_or_extract(chunks):
+    """
+    chunks: list of (chunk_text, text_hash). Returns one extraction per chunk,
+    reading persisted results and extracting (then storing) only what is missing or stale.
+    """
+    keyed = [(text, text_hash or hashlib.md5(text.encode("utf-8")).hexdigest()) for text, text_hash in chunks]
+    found = get_chunk_extractions({h for _, h in keyed})
+
+    missing = {}
+    for text, text_hash in keyed:
+        if text_hash not in found:
+            missing[text_hash] = text
+    if missing:
+        extracted = extract_entities_and_deadlines_batch(list(missing.values()))
+        found.update(zip(missing.keys(), extracted))
+        store_chunk_extractions(list(zip(missing.keys(), extracted)))
+
+    return [found[h] for _, h in keyed]
+
+
+# -------------------------
+# Backfill
+# -------------------------
+def backfill_extractions(table="document_chunks", batch_size=200):
+    """
+    Extracts and stores results for every chunk in `table` that has no
+    extraction for the current EXTRACTOR_VERSION. Returns the number of chunks processed.
+    """
+    if table not in ("document_chunks", "regulations"):
+        raise ValueError(f"Unsupported table '{table}'")
+
+    processed = 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT DISTINCT ON (t.metadata->>'text_hash') t.chunk_text, t.metadata->>'text_hash'
+                FROM {table} t
+                LEFT JOIN chunk_extractions e
+                  ON e.text_hash = t.metadata->>'text_hash' AND e.extractor_version = %s
+                WHERE e.text_hash IS NULL AND t.metadata->>'text_hash' IS NOT NULL
+                LIMIT %s
+            """, (EXTRACTOR_VERSION, batch_size))
+            rows = cur.fetchall()
+        if not rows:
+            break
+
+        extracted = extract_entities_and_deadlines_batch([text or "" for text, _ in rows])
+        store_chunk_extractions([(h, e) for (_, h), e in zip(rows, extracted)])
+        processed += len(rows)
+        print(f"   → {table}: {processed} chunks extracted")
+
+    return processed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill persisted entity/deadline extraction")
+    parser.add_argument("--table", choices=["document_chunks", "regulations", "all"], default="all")
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args()
+
+    tables = ["document_chunks", "regulations"] if args.table == "all" else [args.table]
+    for t in tables:
+        total = backfill_extractions(t, batch_size=args.batch_size)
+        print(f"✅ Backfilled {total} chunks from {t} (extractor v{EXTRACTOR_VERSION})")
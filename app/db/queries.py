@@ -4,6 +4,10 @@ import json
 import hashlib
 from datetime import datetime
 from app.models.embeddings import model2 as embedding_model
+from psycopg2.extras import execute_values
+from app.db.extractions import store_chunk_extractions
+from app.utils.dead import extract_entities_and_deadlines, extract_entities_and_deadlines_batch
+from app.utils.query_cache import query_cache
 
 # -------------------------
 # Internal Compliance Chunks
@@ -33,6 +37,11 @@ def insert_chunk(text, embedding, metadata):
             VALUES (%s, %s::vector, %s)
         """, (text, embedding_str, json.dumps(metadata)))
 
+    # Extract once at ingest so /search and /rag can read it back by text_hash
+    store_chunk_extractions([(text_hash, extract_entities_and_deadlines(text))])
+    # New content: cached /search and /rag results are stale
+    query_cache.bump_corpus_version()
+
 
 # -------------------------
 # Regulation Chunks
@@ -62,6 +71,54 @@ def insert_regulation_chunk(text, embedding, metadata):
             VALUES (%s, %s::vector, %s)
         """, (text, embedding_str, json.dumps(metadata)))
 
+    # Extract once at ingest so /search and /rag can read it back by text_hash
+    store_chunk_extractions([(text_hash, extract_entities_and_deadlines(text))])
+    # New content: cached /search and /rag results are stale
+    query_cache.bump_corpus_version()
+
+
+# -------------------------
+# Bulk insert (streaming ingest)
+# -------------------------
+CHUNK_TABLES = {"document_chunks", "regulations"}
+
+def insert_chunks_bulk(table, items):
+    """
+    items: list of (text, embedding, metadata) for one file.
+    Same duplicate rule as insert_chunk / insert_regulation_chunk (file_name,
+    chunk_index, text_hash), but one lookup, one multi-row INSERT, one batched
+    extraction pass and one cache invalidation per call. Returns rows inserted.
+    """
+    if table not in CHUNK_TABLES:
+        raise ValueError(f"Unknown chunk table '{table}'")
+    if not items:
+        return 0
+
+    rows = []
+    for text, embedding, metadata in items:
+        metadata["text_hash"] = hashlib.md5(text.encode("utf-8")).hexdigest()
+        rows.append((text, "[" + ",".join(str(x) for x in embedding) + "]", metadata))
+
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT metadata->>'chunk_index', metadata->>'text_hash' FROM {table}
+            WHERE (metadata->>'file_name') = %s
+              AND (metadata->>'text_hash') = ANY(%s);
+        """, (rows[0][2]["file_name"], [m["text_hash"] for _, _, m in rows]))
+        existing = set(cur.fetchall())
+        rows = [r for r in rows if (str(r[2]["chunk_index"]), r[2]["text_hash"]) not in existing]
+        if not rows:
+            return 0
+
+        execute_values(cur, f"""
+            INSERT INTO {table} (chunk_text, embedding, metadata) VALUES %s
+        """, [(text, emb, json.dumps(meta)) for text, emb, meta in rows], template="(%s, %s::vector, %s)")
+
+    texts = [text for text, _, _ in rows]
+    store_chunk_extractions(list(zip((m["text_hash"] for _, _, m in rows), extract_entities_and_deadlines_batch(texts))))
+    query_cache.bump_corpus_version()
+    return len(rows)
+
 
 # -------------------------
 # Compliance Flags
@@ -181,18 +238,24 @@ from app.db.connection import conn
 
 def store_clause_regulation_mapping(clause_id: int, mappings: list):
     """
-    mappings: List of dicts with reg_name, article, status, explanation
+    mappings: List of dicts with reg_name, article, status, explanation.
+    Replaces the clause's previous mappings, so re-evaluating a clause (e.g. a
+    resumed batch job) never duplicates rows. Delete and insert are a single
+    statement, hence atomic on the shared autocommit connection.
     """
-    query = """
-        INSERT INTO clause_regulation_mapping
-        (clause_id, reg_name, article, status, explanation)
-        VALUES (%s, %s, %s, %s, %s)
-    """
-    cursor = conn.cursor()
-    for m in mappings:
-        cursor.execute(query, (clause_id, m.get("reg_name"), m.get("article"),
-                               m.get("status"), m.get("explanation")))
-    conn.commit()
+    rows = [(clause_id, m.get("reg_name"), m.get("article"), m.get("status"), m.get("explanation"))
+            for m in mappings]
+    with conn.cursor() as cursor:
+        if not rows:
+            cursor.execute("DELETE FROM clause_regulation_mapping WHERE clause_id = %s", (clause_id,))
+            return
+        values = ", ".join(["(%s, %s, %s, %s, %s)"] * len(rows))
+        cursor.execute(f"""
+            WITH removed AS (DELETE FROM clause_regulation_mapping WHERE clause_id = %s)
+            INSERT INTO clause_regulation_mapping
+            (clause_id, reg_name, article, status, explanation)
+            VALUES {values}
+        """, [clause_id] + [v for row in rows for v in row])
 
 from app.db.connection import conn
 import numpy as np
@@ -237,3 +300,21 @@ def get_all_regulation_chunks():
             "metadata": r[3]
         })
     return regs
+
+
+def get_contract_ids(file_name=None, jurisdiction=None, doc_type=None, limit=None):
+    """
+    Returns contract IDs matching the optional filters, ordered by ID.
+    file_name accepts SQL LIKE wildcards (e.g. 'vendor_%').
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT id
+            FROM contracts
+            WHERE (%s IS NULL OR file_name LIKE %s)
+              AND (%s IS NULL OR jurisdiction = %s)
+              AND (%s IS NULL OR doc_type = %s)
+            ORDER BY id
+            LIMIT %s
+        """, (file_name, file_name, jurisdiction, jurisdiction, doc_type, doc_type, limit))
+        return [r[0] for r in cursor.fetchall()]
@@ -0,0 +1,14 @@
+from fastapi import APIRouter
+from app.utils.query_cache import query_cache
+from app.utils.semantic_cache import semantic_cache
+from ocr.result_cache import result_cache
+
+router = APIRouter()
+
+@router.get("/cache/stats")
+def cache_stats():
+    return {
+        "query_cache": query_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "ocr_cache": result_cache.stats()
+    }
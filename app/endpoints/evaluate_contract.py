@@ -4,18 +4,21 @@ from app.db.connection import conn
 from app.config import HF_TOKEN, LLM_MODEL
 from app.db.queries import get_contract_chunks, get_all_regulation_chunks, store_clause_regulation_mapping
 
-# Config
-from app.config import TOP_K_REGULATIONS, DISTANCE_THRESHOLD
-
 # LLM config
 
 from fastapi import APIRouter
 import time, numpy as np, json, os
 from app.db.connection import conn
 from app.db.queries import get_contract_chunks, get_all_regulation_chunks, store_clause_regulation_mapping
-from app.config import TOP_K_REGULATIONS, DISTANCE_THRESHOLD
 from huggingface_hub import InferenceClient
 from dotenv import load_dotenv
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pydantic import BaseModel
+from typing import List, Optional
+from app.config import EVAL_WORKERS, EVAL_IO_THREADS, EVAL_CHECKPOINT_DIR
+from app.db.queries import get_contract_ids
+from app.utils.contract_matching import select_top_regulations, match_contract_clauses, get_eval_pool
 
 
 # --- Load regulations from DB ---
@@ -30,6 +33,10 @@ else:
     reg_texts = []
     print("⚠️ No regulations found in DB. All clauses will be sent to LLM.\n")
 
+# Norms and (file_name, chunk_index) pairs are all a worker needs to rank regulations
+reg_norms = np.linalg.norm(reg_embeddings, axis=1)
+reg_refs = [(r["metadata"].get("file_name"), r["metadata"].get("chunk_index")) for r in regulations]
+
 # -------------------------------------------------------------------------
 # LLM call via InferenceClient
 # -------------------------------------------------------------------------
@@ -89,17 +96,9 @@ def evaluate_contract(contract_id: int):
         top_regs = []
         if reg_embeddings.shape[0] > 0:
             sims = np.dot(reg_embeddings, clause_embedding) / (
-                np.linalg.norm(reg_embeddings, axis=1) * (np.linalg.norm(clause_embedding) + 1e-10)
+                reg_norms * (np.linalg.norm(clause_embedding) + 1e-10)
             )
-            top_indices = np.argsort(sims)[::-1][:TOP_K_REGULATIONS]
-
-            for i in top_indices:
-                if sims[i] >= DISTANCE_THRESHOLD:
-                    top_regs.append({
-                        "reg_name": regulations[i]["metadata"].get("file_name"),
-                        "article": regulations[i]["metadata"].get("chunk_index"),
-                        "similarity": float(sims[i])
-                    })
+            top_regs = select_top_regulations(sims, reg_refs)
 
         # --- Step 3: Call Zephyr LLM if no strong matches or DB empty ---
         llm_explanation = ""
@@ -128,3 +127,149 @@ def evaluate_contract(contract_id: int):
         "total_time_seconds": time.time() - start_total,
         "response": llm_explanation
     }
+
+# -------------------------------------------------------------------------
+# Batch evaluation (process pool + checkpointing)
+# -------------------------------------------------------------------------
+class BatchEvaluationRequest(BaseModel):
+    contract_ids: Optional[List[int]] = None
+    # Filter used when contract_ids is not given (file_name accepts LIKE wildcards)
+    file_name: Optional[str] = None
+    jurisdiction: Optional[str] = None
+    doc_type: Optional[str] = None
+    limit: Optional[int] = None
+    # Pass the job_id of an interrupted run to resume it
+    job_id: Optional[str] = None
+    workers: Optional[int] = None
+
+def _checkpoint_path(job_id):
+    return os.path.join(EVAL_CHECKPOINT_DIR, f"{job_id}.json")
+
+def _load_checkpoint(job_id):
+    path = _checkpoint_path(job_id)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def _save_checkpoint(state):
+    # Write then rename so an interrupted write never corrupts the checkpoint
+    path = _checkpoint_path(state["job_id"])
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+def _load_contract_clauses(contract_id):
+    clauses = []
+    for chunk in get_contract_chunks(contract_id):
+        clause_text = chunk["text_chunk"].strip()
+        if clause_text:
+            clauses.append((chunk["id"], clause_text, chunk["embedding"]))
+    return clauses
+
+def _store_contract_results(results):
+    """Stores mappings for one contract, asking the LLM about unmatched clauses."""
+    mappings = 0
+    for chunk_id, clause_text, top_regs in results:
+        mappings_to_store = top_regs or [{
+            "reg_name": "LLM_Suggested",
+            "article": "-",
+            "status": "suggested",
+            "explanation": call_llm_for_explanation(clause_text, top_regs)
+        }]
+        store_clause_regulation_mapping(chunk_id, mappings_to_store)
+        mappings += len(mappings_to_store)
+    return mappings
+
+def _evaluate_one_contract(contract_id, pool):
+    """
+    I/O stage, run on a thread: loads the clauses (DB), matches them in the
+    process pool and stores the mappings (DB, plus LLM calls for unmatched
+    clauses). Returns (contract_id, clauses, mappings stored).
+    """
+    clauses = _load_contract_clauses(contract_id)
+    _, results = pool.submit(match_contract_clauses, contract_id, clauses).result()
+    return contract_id, len(results), _store_contract_results(results)
+
+@router.post("/evaluate_contracts")
+def evaluate_contracts(request: BatchEvaluationRequest):
+    """
+    Evaluates many contracts at once. Each contract's clause loading, LLM
+    fallback calls and mapping inserts run on EVAL_IO_THREADS threads; the
+    clause/regulation matching is sharded across a process pool that shares
+    one regulation matrix. Completed contracts are checkpointed so a job can
+    be resumed with its job_id (re-stored mappings replace, not duplicate).
+    """
+    os.makedirs(EVAL_CHECKPOINT_DIR, exist_ok=True)
+    start_total = time.time()
+
+    state = _load_checkpoint(request.job_id) if request.job_id else None
+    if state is None:
+        contract_ids = request.contract_ids if request.contract_ids is not None else get_contract_ids(
+            file_name=request.file_name,
+            jurisdiction=request.jurisdiction,
+            doc_type=request.doc_type,
+            limit=request.limit
+        )
+        state = {
+            "job_id": request.job_id or uuid.uuid4().hex,
+            "contract_ids": contract_ids,
+            "completed": [],
+            "clauses_evaluated": 0,
+            "mappings_stored": 0,
+            "elapsed_seconds": 0.0
+        }
+        _save_checkpoint(state)
+
+    done = set(state["completed"])
+    pending = [cid for cid in state["contract_ids"] if cid not in done]
+    workers = max(1, request.workers or EVAL_WORKERS)
+    print(f"🚀 Batch job {state['job_id']}: {len(pending)} contracts pending "
+          f"({len(done)} already done), {workers} workers, {EVAL_IO_THREADS} I/O threads")
+
+    clauses_this_run = 0
+    if pending:
+        pool = get_eval_pool(workers, reg_embeddings, reg_norms, reg_refs)
+        with ThreadPoolExecutor(max_workers=EVAL_IO_THREADS, thread_name_prefix="eval-io") as io:
+            in_flight = set()
+            queue = iter(pending)
+            while True:
+                # Keep a bounded window of contracts in flight
+                while len(in_flight) < EVAL_IO_THREADS:
+                    contract_id = next(queue, None)
+                    if contract_id is None:
+                        break
+                    in_flight.add(io.submit(_evaluate_one_contract, contract_id, pool))
+                if not in_flight:
+                    break
+
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    contract_id, clauses, mappings = future.result()
+                    state["mappings_stored"] += mappings
+                    state["clauses_evaluated"] += clauses
+                    state["completed"].append(contract_id)
+                    clauses_this_run += clauses
+                    _save_checkpoint(state)
+                    print(f"   ✅ Contract {contract_id}: {clauses} clauses")
+
+    run_seconds = time.time() - start_total
+    state["elapsed_seconds"] += run_seconds
+    _save_checkpoint(state)
+
+    clauses_per_second = clauses_this_run / run_seconds if run_seconds > 0 else 0.0
+    print(f"🏁 Batch job {state['job_id']} finished: {clauses_this_run} clauses "
+          f"in {run_seconds:.2f}s ({clauses_per_second:.1f} clauses/s)")
+
+    return {
+        "job_id": state["job_id"],
+        "contracts_total": len(state["contract_ids"]),
+        "contracts_evaluated": len(pending),
+        "contracts_resumed": len(done),
+        "clauses_evaluated": state["clauses_evaluated"],
+        "mappings_stored": state["mappings_stored"],
+        "total_time_seconds": state["elapsed_seconds"],
+        "run_time_seconds": run_seconds,
+        "clauses_per_second": clauses_per_second
+    }
@@ -6,6 +6,7 @@ from app.config import DISTANCE_THRESHOLD
 from sentence_transformers import util
 import numpy as np
 import re
+from app.utils.pattern_engine import legal_matcher
 
 def detect_gaps_for_regulation(reg_chunks, top_k=5):
     """
@@ -23,6 +24,8 @@ def detect_gaps_for_regulation(reg_chunks, top_k=5):
         reg_text = reg_chunk['text']
         reg_page = reg_chunk['page']
         reg_emb = model.encode(reg_text)
+        reg_groups = legal_matcher.groups_in(reg_text)
+        reg_max_one_year = re.search(r"\bmax(?:imum)?\s*1\s+year\b", reg_text, re.IGNORECASE)
 
         for contract in contracts:
             contract_id, contract_text, contract_meta, contract_emb_db = contract
@@ -35,9 +38,11 @@ def detect_gaps_for_regulation(reg_chunks, top_k=5):
             geo_flag = retention_flag = encryption_flag = False
             action_steps = []
 
+            contract_groups = legal_matcher.groups_in(contract_text)
+
             # Geo/location check
-            if re.search(r"\b(EU|Europe|European Union)\b", reg_text, re.IGNORECASE):
-                if re.search(r"\b(us|usa|us-east-1|us-west-2|india|ap-south-1)\b", contract_text, re.IGNORECASE):
+            if "eu_region" in reg_groups:
+                if "non_eu_region" in contract_groups:
                     geo_flag = True
                     action_steps.append(
                         "Move your database to an EU region or implement lawful transfer mechanisms (SCCs)."
@@ -47,7 +52,7 @@ def detect_gaps_for_regulation(reg_chunks, top_k=5):
             retention_match = re.search(r"retain(ed|ion).*?(\d+)\s+years?", contract_text, re.IGNORECASE)
             if retention_match:
                 years = int(retention_match.group(2))
-                if re.search(r"\bmax(?:imum)?\s*1\s+year\b", reg_text, re.IGNORECASE):
+                if reg_max_one_year:
                     if years > 1:
                         retention_flag = True
                         action_steps.append(
@@ -55,8 +60,8 @@ def detect_gaps_for_regulation(reg_chunks, top_k=5):
                         )
 
             # Encryption check
-            if re.search(r"\bencrypted\b|\bTLS\b|\bencryption at rest\b", reg_text, re.IGNORECASE):
-                if not re.search(r"\bencrypted\b|\bTLS\b|\bencryption at rest\b", contract_text, re.IGNORECASE):
+            if "encryption" in reg_groups:
+                if "encryption" not in contract_groups:
                     encryption_flag = True
                     action_steps.append(
                         "Enable encryption at rest and TLS in transit; update config & document keys."
@@ -1,81 +1,247 @@
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, FileResponse
 from pathlib import Path
-import shutil
+from typing import Optional
 import uuid
 import logging
 import os
 
-# Import OCR + summarizer from repo root ocr package
-# (ensure ocr/ is on PYTHONPATH or project root is package root)
-from ocr.process_doc import process_pdf
-from ocr.summarizer import run as summarizer_run
+# OCR + summarizer come from the repo root ocr package
+# (ensure ocr/ is on PYTHONPATH or project root is package root). They are
+# imported inside the job handler so API startup does not load the OCR stack.
+from ocr.engines import registry as ocr_engines
+from ocr.result_cache import copy_and_hash
+from app.utils.ingest_jobs import ingest_jobs, QueueFull
 
 router = APIRouter()
 logger = logging.getLogger("ingest")
 logger.setLevel(logging.INFO)
 
+INDEX_TABLES = {"document": "document_chunks", "regulation": "regulations"}
+
+def run_ingest_job(job_id, params):
+    """
+    OCR (process_pdf) streaming pages into chunk -> embed -> bulk insert, then
+    summarizer.run on the produced OCR JSON, reporting per-page progress.
+    """
+    from ocr.process_doc import process_pdf
+    from ocr.summarizer import run as summarizer_run
+    from app.utils.streaming_ingest import StreamingIndexer
+
+    saved_path = Path(params["saved_path"])
+    outputs_dir = Path(params["outdir"])
+    outputs_dir.mkdir(parents=True, exist_ok=True)
+
+    table = INDEX_TABLES.get(params.get("index_as", "document"))
+    indexer = None
+    if table:
+        indexer = StreamingIndexer(
+            params["uploaded_filename"], table=table, doc_type=params.get("doc_type"),
+            jurisdiction=params.get("jurisdiction") or "company",
+            extra_metadata={"content_hash": params["content_hash"]}
+        )
+
+    def on_page(page, done, total):
+        ingest_jobs.page_done(job_id, page, done, total)
+        if indexer:
+            indexer.feed(page)
+
+    # Run OCR -> returns metadata / tables and writes outputs/<stem>_<job>.ocrp
+    try:
+        ocr_result = process_pdf(
+            str(saved_path), outdir=str(outputs_dir), max_pages=params["max_pages"], dpi=params["dpi"],
+            workers=params["ocr_workers"], text_layer=params["text_layer"],
+            adaptive_dpi=params["adaptive_dpi"], content_hash=params["content_hash"],
+            progress=on_page, return_pages=False, json_export=params.get("json_export"),
+            # Same upload, same saved name: the job id keeps concurrent jobs' outputs apart
+            stem=f"{saved_path.stem}_{job_id[:8]}"
+        )
+    except Exception:
+        if indexer:
+            try:
+                indexer.close()  # keep what was already indexed
+            except Exception:
+                pass
+        raise
+    index_stats = None
+    if indexer:
+        ingest_jobs.update(job_id, stage="indexing")
+        index_stats = indexer.close()
+        ingest_jobs.update(job_id, index=index_stats)
+
+    # process_pdf writes outputs/<stem>_<job>.ocrp; the summarizer reads it page by page
+    ocr_store_path = ocr_result["store_path"]
+
+    # Summarize
+    ingest_jobs.update(job_id, stage="summarizing")
+    summary_result = summarizer_run(ocr_store_path, outdir=str(outputs_dir),
+                                    content_hash=params["content_hash"],
+                                    mode=params.get("summary_mode", "abstractive"))
+
+    # Compact result (the full OCR JSON can be large)
+    return {
+        "uploaded_filename": params["uploaded_filename"],
+        "saved_path": str(saved_path),
+        "content_hash": params["content_hash"],
+        "ocr_store_path": ocr_store_path,
+        "ocr_json_path": ocr_result["json_path"],
+        "pages_cached": ocr_result["metadata"].get("pages_cached"),
+        "pages_ocr": ocr_result["metadata"].get("pages_ocr"),
+        "pages_native": ocr_result["metadata"].get("pages_native"),
+        "dpi_modes": ocr_result["metadata"].get("dpi_modes"),
+        "tables": len(ocr_result.get("tables", [])),
+        "index": index_stats,
+        "summary_cached": summary_result.get("cached", False),
+        "wordcloud_url": f"/ingest/jobs/{job_id}/wordcloud",
+        "summary": summary_result
+    }
+
 @router.post("/ingest")
-async def ingest_pdf(
+def ingest_pdf(
     file: UploadFile = File(...),
     max_pages: int = Form(3),
     dpi: int = Form(300),
-    outdir: str = Form("outputs")
+    outdir: str = Form("outputs"),
+    ocr_workers: Optional[int] = Form(None),
+    text_layer: str = Form("auto"),
+    adaptive_dpi: Optional[bool] = Form(None),
+    priority: int = Form(5),
+    index_as: str = Form("document"),
+    doc_type: Optional[str] = Form(None),
+    jurisdiction: Optional[str] = Form(None),
+    json_export: bool = Form(False),
+    summary_mode: str = Form("abstractive")
 ):
     """
-    Upload a PDF, run OCR (process_pdf) then summarizer.run on the produced OCR JSON.
-    Returns combined OCR JSON and summarization result.
+    Upload a PDF and queue it for OCR, indexing and summarization.
+    index_as: "document" (document_chunks), "regulation" (regulations) or "none".
+    summary_mode: "abstractive" (BART) or "extractive" (key sentences with page/line refs, fast).
+    Returns a job id immediately; poll /ingest/jobs/{job_id} for progress and results.
+    Lower priority values run first.
     """
-    uploads_dir = Path("uploads")
-    outputs_dir = Path(outdir)
+    if index_as not in INDEX_TABLES and index_as != "none":
+        raise HTTPException(status_code=400, detail="index_as must be 'document', 'regulation' or 'none'")
+    if summary_mode not in ("abstractive", "extractive"):
+        raise HTTPException(status_code=400, detail="summary_mode must be 'abstractive' or 'extractive'")
+
+    # Clients may omit the multipart filename; the hash prefix keeps saved names unique anyway
+    filename = Path(file.filename or "").name or "upload.pdf"
 
+    uploads_dir = Path("uploads")
     uploads_dir.mkdir(parents=True, exist_ok=True)
-    outputs_dir.mkdir(parents=True, exist_ok=True)
 
-    # Save uploaded file
-    unique_prefix = uuid.uuid4().hex
-    saved_name = f"{unique_prefix}_{file.filename}"
-    saved_path = uploads_dir / saved_name
+    # Save uploaded file, hashing it as it streams to disk; the hash names the
+    # file and keys the OCR / summary caches
+    tmp_path = uploads_dir / f"{uuid.uuid4().hex}.part"
 
     try:
-        with saved_path.open("wb") as dst:
-            shutil.copyfileobj(file.file, dst)
+        with tmp_path.open("wb") as dst:
+            content_hash, size = copy_and_hash(file.file, dst)
+        saved_path = uploads_dir / f"{content_hash[:16]}_{filename}"
+        os.replace(tmp_path, saved_path)
 
-        logger.info(f"Saved upload to {saved_path}")
+        logger.info(f"Saved upload to {saved_path} ({size} bytes, sha256 {content_hash[:16]})")
 
-        # Run OCR -> returns JSON-like dict and writes outputs/<stem>.json
-        ocr_result = process_pdf(str(saved_path), outdir=str(outputs_dir), max_pages=max_pages, dpi=dpi)
-
-        # The process_pdf writes outputs/<stem>.json. Build path and call summarizer.
-        ocr_json_path = outputs_dir / f"{Path(saved_path).stem}.json"
-        if not ocr_json_path.exists():
-            # If process_pdf returned dict but did not write file, try to use the dict to save then summarize
-            try:
-                import json
-                with open(ocr_json_path, "w", encoding="utf-8") as f:
-                    json.dump(ocr_result, f, ensure_ascii=False, indent=2)
-            except Exception as e:
-                logger.warning(f"Could not write ocr json to {ocr_json_path}: {e}")
-
-        # Summarize
-        summary_result = summarizer_run(str(ocr_json_path), outdir=str(outputs_dir))
-
-        # Build a compact response (the full OCR JSON can be large)
-        response = {
-            "status": "success",
-            "uploaded_filename": file.filename,
+        job_id = ingest_jobs.submit({
+            "uploaded_filename": filename,
             "saved_path": str(saved_path),
-            "ocr_json_path": str(ocr_json_path),
-            "ocr": ocr_result,
-            "summary": summary_result
-        }
-        return JSONResponse(status_code=200, content=response)
+            "content_hash": content_hash,
+            "outdir": outdir,
+            "max_pages": max_pages,
+            "dpi": dpi,
+            "ocr_workers": ocr_workers,
+            "text_layer": text_layer,
+            "adaptive_dpi": adaptive_dpi,
+            "index_as": index_as,
+            "doc_type": doc_type,
+            "jurisdiction": jurisdiction,
+            "json_export": json_export,
+            "summary_mode": summary_mode
+        }, priority=priority)
 
+        return JSONResponse(status_code=202, content={
+            "status": "queued",
+            "job_id": job_id,
+            "status_url": f"/ingest/jobs/{job_id}",
+            "uploaded_filename": filename,
+            "content_hash": content_hash
+        })
+
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
-        logger.exception("Ingest processing failed")
+        logger.exception("Ingest upload failed")
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         try:
             file.file.close()
         except Exception:
-            pass
\ No newline at end of file
+            pass
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+@router.get("/ingest/jobs/{job_id}")
+def ingest_job_status(job_id: str):
+    """Job state, per-page progress (counts only; text via /pages/{n}) and (when done) the result."""
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown ingestion job {job_id}")
+    return job
+
+def _finished_page_from_cache(job, page_number):
+    """A page a running job has already finished, from the OCR result cache."""
+    if not any(p.get("page_number") == page_number for p in job.get("pages", [])):
+        return None
+    from ocr.process_doc import page_cache_key, OCR_TEXT_LAYER, OCR_ADAPTIVE_DPI
+    from ocr.result_cache import result_cache
+
+    params = job["params"]
+    adaptive_dpi = OCR_ADAPTIVE_DPI if params.get("adaptive_dpi") is None else params["adaptive_dpi"]
+    key = page_cache_key(params["content_hash"], page_number - 1, params["dpi"],
+                         params.get("text_layer") or OCR_TEXT_LAYER, adaptive_dpi)
+    return result_cache.get(key)
+
+@router.get("/ingest/jobs/{job_id}/pages/{page_number}")
+def ingest_job_page(job_id: str, page_number: int):
+    """
+    One OCR page: read lazily from the page store of a finished job, or, while
+    the job runs, from the OCR cache once that page is done.
+    """
+    from ocr.page_store import PageStore
+
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown ingestion job {job_id}")
+    store_path = (job.get("result") or {}).get("ocr_store_path")
+    if not store_path or not os.path.exists(store_path):
+        page = _finished_page_from_cache(job, page_number)
+        if page is None:
+            raise HTTPException(status_code=409, detail=f"Page {page_number} of job {job_id} is not ready (status: {job['status']})")
+        return page
+    with PageStore(store_path) as store:
+        try:
+            return store.page(page_number)
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"Page {page_number} was not processed")
+
+@router.get("/ingest/jobs/{job_id}/wordcloud")
+def ingest_job_wordcloud(job_id: str):
+    """Word cloud PNG of a finished job, rendered on first request and cached by content hash + OCR options."""
+    from ocr.summarizer import cached_wordcloud
+
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown ingestion job {job_id}")
+    result = job.get("result") or {}
+    store_path = result.get("ocr_store_path")
+    if not store_path or not os.path.exists(store_path):
+        raise HTTPException(status_code=409, detail=f"Job {job_id} has no OCR output yet (status: {job['status']})")
+    params = job.get("params") or {}
+    ocr_params = {k: params.get(k) for k in ("max_pages", "dpi", "text_layer", "adaptive_dpi")}
+    png_path = cached_wordcloud(store_path, content_hash=result.get("content_hash"), ocr_params=ocr_params)
+    return FileResponse(png_path, media_type="image/png")
+
+@router.get("/ingest/engines")
+def ocr_engine_stats():
+    """Load state, load time and memory of the OCR engines in this API process."""
+    return {**ocr_engines.stats(), "jobs": ingest_jobs.stats()}
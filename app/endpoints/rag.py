@@ -1,17 +1,21 @@
 from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
 from app.models.embeddings import model
 from app.models.llm_client import hf_client, LLM_MODEL
-from app.db.connection import conn
 from app.config import DISTANCE_THRESHOLD
-from app.utils.prioritization import priority_order
-from app.utils.dead import extract_entities_and_deadlines  # <- import extraction
+from app.utils.retrieval import fetch_candidates, select_results, to_vector_literal, resolve_mode
+from app.utils.query_cache import query_cache
+from app.utils.semantic_cache import semantic_cache
+from app.utils.context_packing import pack_context
+import hashlib
+import json
 from app.utils.semantic_matching  import find_top_regulations_by_embedding
 from app.db.queries import get_contract_chunks,store_clause_regulation_mapping, get_all_regulation_chunks
-from app.models.llm_client import evaluate_clause_with_llm , query_llm
+from app.models.llm_client import evaluate_clause_with_llm , query_llm, stream_llm
 import time
-from app.config import TOP_K_REGULATIONS, DISTANCE_THRESHOLD
+from app.config import TOP_K_REGULATIONS
 from sentence_transformers import SentenceTransformer
 import numpy as np
 
@@ -24,115 +28,148 @@ router = APIRouter()
 class QueryRequest(BaseModel):
     query: str
     top_k: int = 3
+    # "vector" (embedding only) or "hybrid" (embedding + full-text, rank-fused)
+    mode: str = "vector"
+    vector_weight: float = 1.0
+    lexical_weight: float = 1.0
+    # Re-rank candidates with the cross-encoder (falls back to vector order over budget)
+    rerank: bool = False
+    # Overrides RAG_CONTEXT_TOKEN_BUDGET for this request
+    context_token_budget: Optional[int] = None
+
+def _rag_cache_key(request, jurisdiction):
+    return query_cache.make_key(
+        "rag", request.query, top_k=request.top_k, jurisdiction=jurisdiction,
+        threshold=DISTANCE_THRESHOLD, mode=resolve_mode(request.mode),
+        vector_weight=request.vector_weight, lexical_weight=request.lexical_weight,
+        rerank=request.rerank, context_token_budget=request.context_token_budget
+    )
 
-@router.post("/rag")
-def rag_response(request: QueryRequest, jurisdiction: Optional[str] = "local"):
-    query_embedding = model.encode(request.query).tolist()
-    query_embedding_str = "[" + ",".join(str(x) for x in query_embedding) + "]"
-
-    with conn.cursor() as cur:
-        cur.execute("""
-            SELECT chunk_text, metadata, embedding <-> %s::vector AS distance
-            FROM document_chunks
-            ORDER BY embedding <-> %s::vector
-            LIMIT %s;
-        """, (query_embedding_str, query_embedding_str, request.top_k * 5))
-        results = cur.fetchall()
-
-    seen_hashes = set()
-    filtered = []
-
-    for row in results:
-        chunk_text = row[0]
-        meta = row[1]
-        distance = float(row[2])
-
-        # Deduplication
-        text_hash = meta.get("text_hash")
-        if text_hash in seen_hashes:
-            continue
-        seen_hashes.add(text_hash)
-
-        # Jurisdiction filter
-        chunk_jurisdiction = meta.get("jurisdiction", "company")
-        if jurisdiction and chunk_jurisdiction != jurisdiction:
-            continue
-
-        if distance <= DISTANCE_THRESHOLD:
-            # --- Run extraction here ---
-            extracted_info = extract_entities_and_deadlines(chunk_text)
-
-            filtered.append({
-                "chunk_text": chunk_text,
-                "metadata": {
-                    "file_name": meta.get("file_name"),
-                    "page": meta.get("page"),
-                    "chunk_index": meta.get("chunk_index"),
-                    "doc_type": meta.get("doc_type"),
-                    "jurisdiction": chunk_jurisdiction,
-                    "deadlines": extracted_info.get("deadlines", []),
-                    "consequences": extracted_info.get("consequences", []),
-                    "entities": extracted_info.get("entities", []),
-                    "references": extracted_info.get("references", [])
-                },
-                "distance": distance,
-                "priority": priority_order.get(chunk_jurisdiction, 3)
-            })
-
-    # Sort by priority then distance
-    filtered = sorted(filtered, key=lambda x: (x["priority"], x["distance"]))[:request.top_k]
-
-    # Build context with metadata
-    if filtered:
-        context = "\n\n".join(
-            f"Chunk {i+1}:\nText: {row['chunk_text']}\nEntities: {row['metadata']['entities']}\n"
-            f"Deadlines: {row['metadata']['deadlines']}\nConsequences: {row['metadata']['consequences']}\n"
-            f"References: {row['metadata']['references']}"
-            for i, row in enumerate(filtered)
-        )
-    else:
-        context = "No context found."
-
-    messages = [
-        {"role": "system", "content": "You are a legal AI that explains compliance, deadlines, and penalties clearly."},
-        {"role": "user", "content": f"Question: {request.query}\n\nContext:\n{context}\n\nAnswer:"}
-    ]
-
-    response = hf_client.chat_completion(
-        model=LLM_MODEL,
-        messages=messages,
-        max_tokens=300,
-        temperature=0.7
+def _prepare_rag(request, jurisdiction):
+    """
+    Retrieval + prompt building shared by /rag and /rag/stream.
+    Returns (context chunks, LLM messages, query embedding, context chunk hashes, packing stats).
+    """
+    query_vector = model.encode(request.query)
+    query_embedding_str = to_vector_literal(query_vector.tolist())
+
+    mode = resolve_mode(request.mode)
+    rows = fetch_candidates(
+        request.query, query_embedding_str, request.top_k, mode=mode,
+        vector_weight=request.vector_weight, lexical_weight=request.lexical_weight
+    )
+    filtered, rerank_info = select_results(
+        rows, jurisdiction, request.top_k, rerank_query=request.query if request.rerank else None
     )
-    answer = response.choices[0].message["content"]
 
-    return {
-        "query": request.query,
-        "context_chunks": filtered,
-        "response": answer,
-        "threshold": DISTANCE_THRESHOLD
-    }
+    # Pack the highest-priority chunks into the token budget
+    context, packing = pack_context(filtered, budget=request.context_token_budget)
 
-    # --- Step 6: Build messages for LLM ---
     messages = [
         {"role": "system", "content": "You are a legal AI that explains compliance, deadlines, and penalties clearly."},
         {"role": "user", "content": f"Question: {request.query}\n\nContext:\n{context}\n\nAnswer:"}
     ]
 
-    # --- Step 7: Call LLM ---
-    response = hf_client.chat_completion(
-        model=LLM_MODEL,
-        messages=messages,
-        max_tokens=300,
-        temperature=0.7
-    )
-    answer = response.choices[0].message["content"]
+    context_ids = [hashlib.md5(row["chunk_text"].encode("utf-8")).hexdigest() for row in filtered]
+    if rerank_info is not None:
+        packing["rerank"] = rerank_info
+    if mode != request.mode:
+        packing["mode_fallback"] = mode
+    return filtered, messages, query_vector, context_ids, packing
 
-    # --- Step 8: Return structured response ---
-    return {
+@router.post("/rag")
+def rag_response(request: QueryRequest, jurisdiction: Optional[str] = "local"):
+    cache_key = _rag_cache_key(request, jurisdiction)
+    cached = query_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    filtered, messages, query_vector, context_ids, packing = _prepare_rag(request, jurisdiction)
+
+    # Same question (by embedding) over the same chunks (by content hash) -> reuse the answer
+    answer = semantic_cache.lookup(query_vector, context_ids)
+    semantic_hit = answer is not None
+
+    if not semantic_hit:
+        response = hf_client.chat_completion(
+            model=LLM_MODEL,
+            messages=messages,
+            max_tokens=300,
+            temperature=0.7
+        )
+        answer = response.choices[0].message["content"]
+        semantic_cache.add(query_vector, context_ids, answer)
+
+    result = {
         "query": request.query,
         "context_chunks": filtered,
         "response": answer,
-        "threshold": DISTANCE_THRESHOLD
+        "threshold": DISTANCE_THRESHOLD,
+        "semantic_cache_hit": semantic_hit,
+        "context_packing": packing
     }
-
+    query_cache.set(cache_key, result)
+    return result
+
+# -------------------------
+# Streaming variant (Server-Sent Events)
+# -------------------------
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@router.post("/rag/stream")
+def rag_stream(request: QueryRequest, jurisdiction: Optional[str] = "local"):
+    """
+    Same answer as /rag, streamed as Server-Sent Events:
+    one `context` event with the retrieved chunks, `token` events while the
+    LLM generates, then `done` with the full response (or `error`).
+    """
+    cache_key = _rag_cache_key(request, jurisdiction)
+    cached = query_cache.get(cache_key)
+
+    if cached is None:
+        filtered, messages, query_vector, context_ids, packing = _prepare_rag(request, jurisdiction)
+
+    def events():
+        if cached is not None:
+            yield _sse("context", {k: cached.get(k) for k in ("query", "context_chunks", "threshold", "context_packing")})
+            yield _sse("token", {"text": cached["response"]})
+            yield _sse("done", {"response": cached["response"], "semantic_cache_hit": cached.get("semantic_cache_hit", False)})
+            return
+
+        yield _sse("context", {
+            "query": request.query, "context_chunks": filtered,
+            "threshold": DISTANCE_THRESHOLD, "context_packing": packing
+        })
+
+        answer = semantic_cache.lookup(query_vector, context_ids)
+        semantic_hit = answer is not None
+        if semantic_hit:
+            yield _sse("token", {"text": answer})
+        else:
+            parts = []
+            try:
+                for token in stream_llm(messages, max_tokens=300, temperature=0.7):
+                    parts.append(token)
+                    yield _sse("token", {"text": token})
+            except Exception as e:
+                yield _sse("error", {"detail": str(e)})
+                return
+            answer = "".join(parts)
+            semantic_cache.add(query_vector, context_ids, answer)
+
+        query_cache.set(cache_key, {
+            "query": request.query,
+            "context_chunks": filtered,
+            "response": answer,
+            "threshold": DISTANCE_THRESHOLD,
+            "semantic_cache_hit": semantic_hit,
+            "context_packing": packing
+        })
+        yield _sse("done", {"response": answer, "semantic_cache_hit": semantic_hit})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
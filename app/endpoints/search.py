@@ -1,79 +1,88 @@
 from fastapi import APIRouter
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List
 from app.models.embeddings import model
-from app.db.connection import conn
-from app.config import DISTANCE_THRESHOLD
-from app.utils.prioritization import priority_order
-from app.utils.dead import extract_entities_and_deadlines  # <- run extraction on search
+from app.config import DISTANCE_THRESHOLD, SEARCH_BATCH_ENCODE_SIZE
+from app.utils.retrieval import (
+    fetch_candidates, fetch_candidates_batch, select_results, attach_extractions, to_vector_literal,
+    resolve_mode
+)
+from app.utils.query_cache import query_cache
 
 router = APIRouter()
 
 class QueryRequest(BaseModel):
     query: str
     top_k: int = 3
+    # "vector" (embedding only) or "hybrid" (embedding + full-text, rank-fused)
+    mode: str = "vector"
+    vector_weight: float = 1.0
+    lexical_weight: float = 1.0
+    # Re-rank candidates with the cross-encoder (falls back to vector order over budget)
+    rerank: bool = False
 
 @router.post("/search")
 def search_docs(request: QueryRequest, jurisdiction: Optional[str] = "local"):
-    query_embedding = model.encode(request.query).tolist()
-    query_embedding_str = "[" + ",".join(str(x) for x in query_embedding) + "]"
-
-    with conn.cursor() as cur:
-        cur.execute("""
-            SELECT chunk_text, metadata, embedding <-> %s::vector AS distance
-            FROM document_chunks
-            ORDER BY embedding <-> %s::vector
-            LIMIT %s;
-        """, (query_embedding_str, query_embedding_str, request.top_k * 5))
-        results = cur.fetchall()
-
-    seen_hashes = set()
-    response = []
+    mode = resolve_mode(request.mode)
+    cache_key = query_cache.make_key(
+        "search", request.query, top_k=request.top_k, jurisdiction=jurisdiction,
+        threshold=DISTANCE_THRESHOLD, mode=mode,
+        vector_weight=request.vector_weight, lexical_weight=request.lexical_weight,
+        rerank=request.rerank
+    )
+    cached = query_cache.get(cache_key)
+    if cached is not None:
+        return cached
 
-    for row in results:
-        chunk_text = row[0]
-        meta = row[1]
-        distance = float(row[2])
+    query_embedding = model.encode(request.query).tolist()
+    query_embedding_str = to_vector_literal(query_embedding)
 
-        # Deduplication
-        text_hash = meta.get("text_hash")
-        if text_hash in seen_hashes:
-            continue
-        seen_hashes.add(text_hash)
+    rows = fetch_candidates(
+        request.query, query_embedding_str, request.top_k, mode=mode,
+        vector_weight=request.vector_weight, lexical_weight=request.lexical_weight
+    )
+    response, rerank_info = select_results(
+        rows, jurisdiction, request.top_k, rerank_query=request.query if request.rerank else None
+    )
 
-        # Jurisdiction filter
-        chunk_jurisdiction = meta.get("jurisdiction", "company")
-        if jurisdiction and chunk_jurisdiction != jurisdiction:
-            continue
+    result = {
+        "results": response,
+        "threshold": DISTANCE_THRESHOLD
+    }
+    if rerank_info is not None:
+        result["rerank"] = rerank_info
+    if mode != request.mode:
+        result["mode_fallback"] = mode
+    query_cache.set(cache_key, result)
+    return result
 
-        # Distance threshold filter
-        if distance > DISTANCE_THRESHOLD:
-            continue
 
-        # --- Run extraction on chunk text ---
-        extracted_info = extract_entities_and_deadlines(chunk_text)
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    top_k: int = 3
 
-        response.append({
-            "chunk_text": chunk_text,
-            "metadata": {
-                "file_name": meta.get("file_name"),
-                "page": meta.get("page"),
-                "chunk_index": meta.get("chunk_index"),
-                "doc_type": meta.get("doc_type"),
-                "jurisdiction": chunk_jurisdiction,
-                "deadlines": extracted_info.get("deadlines", []),
-                "consequences": extracted_info.get("consequences", []),
-                "entities": extracted_info.get("entities", []),
-                "references": extracted_info.get("references", [])
-            },
-            "distance": distance,
-            "priority": priority_order.get(chunk_jurisdiction, 3)
-        })
+@router.post("/search/batch")
+def search_docs_batch(request: BatchQueryRequest, jurisdiction: Optional[str] = "local"):
+    """
+    Vector search for many queries at once: one batched encoder pass, one SQL
+    statement for every top-k lookup and one extraction lookup for all hits.
+    Results are returned in input order.
+    """
+    embeddings = model.encode(request.queries, batch_size=SEARCH_BATCH_ENCODE_SIZE)
+    rows_per_query = fetch_candidates_batch(
+        [to_vector_literal(e.tolist()) for e in embeddings], request.top_k
+    )
 
-    # Sort by priority then distance
-    response = sorted(response, key=lambda x: (x["priority"], x["distance"]))[:request.top_k]
+    per_query = [
+        select_results(rows, jurisdiction, request.top_k, with_extractions=False)[0]
+        for rows in rows_per_query
+    ]
+    attach_extractions([r for results in per_query for r in results])
 
     return {
-        "results": response,
+        "results": [
+            {"query": query, "results": results}
+            for query, results in zip(request.queries, per_query)
+        ],
         "threshold": DISTANCE_THRESHOLD
     }
@@ -3,6 +3,8 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from app.endpoints import ingest, search, rag, check_regulation, audit, compliance, tune
 from app.endpoints import evaluate_contract 
+from app.endpoints import cache
+from app.db.create_tables import create_all_tables
 
 app = FastAPI(title="Legal RAG API", version="6.0")
 # ✅ Add CORS middleware
@@ -23,6 +25,21 @@ app.include_router(audit.router,  tags=["Audit"])
 app.include_router(compliance.router, tags=["Compliance"])
 app.include_router(tune.router,  tags=["Tune"])
 app.include_router(evaluate_contract.router, prefix="/rag", tags=["Contract Evaluation"])
+app.include_router(cache.router, tags=["Cache"])
+
+@app.on_event("startup")
+def ensure_schema():
+    # chunk_extractions and the audit tables; the hybrid-search indexes are a
+    # separate migration (python -m app.db.create_tables --search-indexes)
+    try:
+        create_all_tables()
+    except Exception as e:
+        print(f"❌ Schema setup failed: {e}")
+
+@app.on_event("startup")
+def start_ingest_workers():
+    # Also resumes jobs left unfinished by a previous process
+    ingest.ingest_jobs.start(ingest.run_ingest_job)
 
 @app.get("/")
 def root():
@@ -30,11 +47,17 @@ def root():
         "message": "🚀 Legal RAG API with NER + Compliance Classification + Audit Trail",
         "endpoints": {
             "Upload PDF": "/ingest",
+            "Ingest Job Status": "/ingest/jobs/{job_id}",
+            "Ingest Word Cloud": "/ingest/jobs/{job_id}/wordcloud",
+            "OCR Engines": "/ingest/engines",
             "Semantic Search": "/search",
+            "Batch Search": "/search/batch",
             "RAG Answer": "/rag",
+            "RAG Answer (streaming)": "/rag/stream",
             "Tune Threshold": "/tune",
             "Check Regulation": "/check-regulation",
             "Compliance Flags": "/compliance-flags",
-            "Audit Action": "/audit-action"
+            "Audit Action": "/audit-action",
+            "Cache Stats": "/cache/stats"
         }
     }
@@ -1,6 +1,7 @@
 # app/models/llm_client.py
+import time
 from huggingface_hub import InferenceClient
-from app.config import HF_TOKEN, LLM_MODEL
+from app.config import HF_TOKEN, LLM_MODEL, LLM_STREAM_STUB, LLM_STREAM_STUB_DELAY
 from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
 
 
@@ -10,6 +11,29 @@ def query_llm(messages, max_tokens=300, temperature=0.7):
     response = hf_client.chat_completion(model=LLM_MODEL, messages=messages, max_tokens=max_tokens, temperature=temperature)
     return response.choices[0].message["content"]
 
+def fake_stream_llm(messages, max_tokens=300, temperature=0.7):
+    """
+    Local stand-in for the streaming LLM (LLM_STREAM_STUB=1): yields a canned
+    answer word by word with a small delay, so streaming can be tested offline.
+    """
+    question = messages[-1]["content"].split("\n", 1)[0]
+    words = f"Stub answer. {question}".split()[:max_tokens]
+    for i, word in enumerate(words):
+        time.sleep(LLM_STREAM_STUB_DELAY)
+        yield word if i == 0 else " " + word
+
+def stream_llm(messages, max_tokens=300, temperature=0.7):
+    """Yields answer text pieces as the model generates them."""
+    if LLM_STREAM_STUB:
+        yield from fake_stream_llm(messages, max_tokens=max_tokens, temperature=temperature)
+        return
+    for chunk in hf_client.chat_completion(
+        model=LLM_MODEL, messages=messages, max_tokens=max_tokens, temperature=temperature, stream=True
+    ):
+        token = chunk.choices[0].delta.content
+        if token:
+            yield token
+
 
 # Load HuggingFace model
 tokenizer = AutoTokenizer.from_pretrained(LLM_MODEL, use_auth_token=HF_TOKEN)
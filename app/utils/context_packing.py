@@ -0,0 +1,126 @@
+# app/utils/context_packing.py
+import re
+from app.models.llm_client import tokenizer
+from app.config import RAG_CONTEXT_TOKEN_BUDGET
+
+# ----------------------------------------------------------------------
+# Token-budgeted context packing for RAG prompts
+# ----------------------------------------------------------------------
+# Chunks arrive highest-priority first. Each one is rendered compactly:
+#   - deadline / consequence sentences are tagged inline instead of repeated,
+#   - whole-chunk OBLIGATION / PENALTY entities become short flags,
+#   - sentences already packed from an earlier (overlapping) chunk are skipped,
+# then added until the token budget is spent.
+
+_sentence_split = re.compile(r"(?<=[.!?])\s+")
+FLAG_LABELS = {"OBLIGATION": "obligation", "PENALTY": "penalty"}
+MIN_PARTIAL_TOKENS = 32  # don't bother packing a sliver of a chunk
+
+def count_tokens(text: str) -> int:
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+def legacy_context(rows):
+    """The unpacked context format, used to report tokens saved."""
+    return "\n\n".join(
+        f"Chunk {i+1}:\nText: {row['chunk_text']}\nEntities: {row['metadata']['entities']}\n"
+        f"Deadlines: {row['metadata']['deadlines']}\nConsequences: {row['metadata']['consequences']}\n"
+        f"References: {row['metadata']['references']}"
+        for i, row in enumerate(rows)
+    )
+
+def _normalize(sentence):
+    return " ".join(sentence.lower().split())
+
+def _chunk_header(index, meta):
+    flags, entities, seen = [], [], set()
+    for ent in meta.get("entities", []):
+        if ent["label"] in FLAG_LABELS:
+            if FLAG_LABELS[ent["label"]] not in flags:
+                flags.append(FLAG_LABELS[ent["label"]])
+        elif (ent["text"], ent["label"]) not in seen:
+            seen.add((ent["text"], ent["label"]))
+            entities.append(f"{ent['text']} ({ent['label']})")
+
+    source = meta.get("file_name") or "unknown"
+    if meta.get("page") is not None:
+        source += f" p.{meta['page']}"
+    lines = [f"Chunk {index} [{source}]"]
+    if flags:
+        lines.append("Flags: " + ", ".join(flags))
+    if entities:
+        lines.append("Entities: " + "; ".join(entities))
+    if meta.get("references"):
+        lines.append("References: " + ", ".join(dict.fromkeys(meta["references"])))
+    return "\n".join(lines)
+
+def _tagged_sentences(row, seen_sentences):
+    meta = row["metadata"]
+    deadlines = {_normalize(d["sentence"]) for d in meta.get("deadlines", [])}
+    consequences = {_normalize(c["sentence"]) for c in meta.get("consequences", [])}
+
+    sentences = []
+    for sent in _sentence_split.split(" ".join(row["chunk_text"].split())):
+        key = _normalize(sent)
+        if not key or key in seen_sentences:
+            continue
+        # Extraction used spaCy's sentence split, so match by containment either way
+        is_deadline = any(key in d or d in key for d in deadlines)
+        is_consequence = any(key in c or c in key for c in consequences)
+        tags = ("[DEADLINE] " if is_deadline else "") + ("[CONSEQUENCE] " if is_consequence else "")
+        sentences.append((key, tags + sent))
+    return sentences
+
+def pack_context(rows, budget=None):
+    """
+    Returns (context string, stats). Stats report packed vs. legacy token counts.
+    """
+    budget = budget or RAG_CONTEXT_TOKEN_BUDGET
+    if not rows:
+        return "No context found.", {
+            "context_tokens": 0, "unpacked_tokens": 0, "tokens_saved": 0,
+            "token_budget": budget, "chunks_packed": 0, "chunks_truncated": 0, "chunks_dropped": 0
+        }
+
+    seen_sentences = set()
+    blocks = []
+    used = 0
+    packed = truncated = dropped = 0
+
+    for row in rows:
+        header = _chunk_header(packed + 1, row["metadata"])
+        remaining = budget - used - count_tokens(header) - 4
+        if remaining < MIN_PARTIAL_TOKENS:
+            dropped += 1
+            continue
+
+        kept, cost, complete = [], 0, True
+        for key, sent in _tagged_sentences(row, seen_sentences):
+            sent_tokens = count_tokens(sent) + 1
+            if cost + sent_tokens > remaining:
+                complete = False
+                break
+            kept.append((key, sent))
+            cost += sent_tokens
+        if not kept:
+            dropped += 1
+            continue
+
+        seen_sentences.update(key for key, _ in kept)
+        block = header + "\nText: " + " ".join(sent for _, sent in kept)
+        blocks.append(block)
+        used += count_tokens(block) + 2
+        packed += 1
+        truncated += not complete
+
+    context = "\n\n".join(blocks) or "No context found."
+    context_tokens = count_tokens(context)
+    unpacked_tokens = count_tokens(legacy_context(rows))
+    return context, {
+        "context_tokens": context_tokens,
+        "unpacked_tokens": unpacked_tokens,
+        "tokens_saved": max(0, unpacked_tokens - context_tokens),
+        "token_budget": budget,
+        "chunks_packed": packed,
+        "chunks_truncated": truncated,
+        "chunks_dropped": dropped
+    }
@@ -0,0 +1,72 @@
+# app/utils/contract_matching.py
+import logging
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from app.config import TOP_K_REGULATIONS, DISTANCE_THRESHOLD
+
+# ----------------------------------------------------------------------
+# Clause / regulation matching for /evaluate_contracts
+# ----------------------------------------------------------------------
+# Worker processes are spawned (forking the threaded API process can deadlock
+# on locks held by torch / psycopg threads), so this module must stay light:
+# spawned workers import it, not the endpoint module with its LLM client. The
+# pool is built on first use and reused; each worker receives the regulation
+# matrix once, through the initializer.
+
+logger = logging.getLogger("contract_matching")
+
+_eval_pool = None
+_eval_pool_workers = None
+_worker_regs = None  # set once per worker process by _init_eval_worker
+
+def select_top_regulations(sims, refs):
+    """Returns the TOP_K_REGULATIONS matches above DISTANCE_THRESHOLD for one clause."""
+    top_regs = []
+    for i in np.argsort(sims)[::-1][:TOP_K_REGULATIONS]:
+        if sims[i] >= DISTANCE_THRESHOLD:
+            top_regs.append({
+                "reg_name": refs[i][0],
+                "article": refs[i][1],
+                "similarity": float(sims[i])
+            })
+    return top_regs
+
+def _init_eval_worker(embeddings, norms, refs):
+    global _worker_regs
+    _worker_regs = (embeddings, norms, refs)
+
+def match_contract_clauses(contract_id, clauses):
+    """
+    Worker task: ranks every clause of one contract against the shared
+    regulation matrix in a single matrix product.
+    clauses: list of (chunk_id, clause_text, embedding)
+    """
+    embeddings, norms, refs = _worker_regs
+    if not clauses or embeddings.shape[0] == 0:
+        return contract_id, [(chunk_id, text, []) for chunk_id, text, _ in clauses]
+
+    clause_matrix = np.array([c[2] for c in clauses], dtype=np.float32)
+    sims = (clause_matrix @ embeddings.T) / (
+        np.outer(np.linalg.norm(clause_matrix, axis=1) + 1e-10, norms)
+    )
+    return contract_id, [
+        (chunk_id, text, select_top_regulations(sims[i], refs))
+        for i, (chunk_id, text, _) in enumerate(clauses)
+    ]
+
+def get_eval_pool(workers, embeddings, norms, refs):
+    """The shared matching pool, (re)built when the worker count changes."""
+    global _eval_pool, _eval_pool_workers
+    if _eval_pool is None or _eval_pool_workers != workers:
+        if _eval_pool is not None:
+            _eval_pool.shutdown(wait=True)
+        _eval_pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_eval_worker,
+            initargs=(embeddings, norms, refs)
+        )
+        _eval_pool_workers = workers
+        logger.info(f"Contract matching pool started with {workers} workers")
+    return _eval_pool
@@ -1,88 +1,58 @@
-import re
-import spacy
-from nltk.tokenize import sent_tokenize
-import nltk
+from app.utils.nlp_engine import analyze_batch
+from app.utils.pattern_engine import legal_matcher, has_sequence, bucket_by_spans, CONSEQUENCE_RULES
 
-nlp = spacy.load("en_core_web_sm")
+# Bump whenever extraction output changes so persisted results get recomputed
+EXTRACTOR_VERSION = 4
 
-# Ensure nltk punkt is available
-def ensure_nltk_data():
-    try:
-        nltk.data.find("tokenizers/punkt")
-    except LookupError:
-        nltk.download("punkt")
+def _extract_from_analysis(analysis):
+    merged_text = analysis["text"]
+    sentences = analysis["sentences"]
 
-ensure_nltk_data()
+    # One linear keyword scan over the chunk, then split the hits per sentence
+    hits = legal_matcher.findall(merged_text)
+    sentence_hits = bucket_by_spans(hits, analysis["sentence_spans"])
 
-# --- Regex patterns ---
-consequence_patterns = [
-    r"(?:if|should|in case|failure to|breach).*?(?:penalt(?:y|ies)|interest|termination|damages?|forfeit|liable|compensation|legal action).*?\.?",
-    r"(?:late|delayed|non[-\s]?performance).*?(?:will|shall|may).*?(?:result|lead).*?(?:penalt(?:y|ies)|interest|termination|damages?|forfeit|liable).*?\.?"
-]
-
-deadline_keywords = [
-    r"(?:no later than|on or before|within|by)",
-    r"(?:completion date|delivery date|due date)"
-]
-
-def extract_entities_and_deadlines(text: str):
-    """
-    Extract full sentences for deadlines, consequences, entities, and references.
-    - Ensures sentences are merged properly (no mid-line splits)
-    - Consequences captured with regex + NLP fallback
-    - Deadlines captured as full sentences containing keywords
-    """
-    # --- 1. Merge lines first to avoid broken sentences ---
-    merged_text = " ".join(line.strip() for line in text.splitlines() if line.strip())
-
-    # --- 2. Sentence tokenization ---
-    sentences = sent_tokenize(merged_text)
-
-    # --- 3. Extract deadlines ---
     deadlines = []
-    for sent in sentences:
-        if any(re.search(kw, sent, re.IGNORECASE) for kw in deadline_keywords):
-            deadlines.append({"sentence": sent.strip()})
-
-    # --- 4. Extract consequences ---
     consequences = []
-    for sent in sentences:
-        for pattern in consequence_patterns:
-            if re.search(pattern, sent, re.IGNORECASE):
-                consequences.append({"sentence": sent.strip(), "method": "regex"})
-                break
-
-    # NLP fallback: check for penalty-related words
-    doc = nlp(merged_text)
-    for sent in doc.sents:
-        if any(word in sent.text.lower() for word in [
-            "penalty", "interest", "termination", "breach", "damages", "liable", "compensation"
-        ]):
-            if sent.text.strip() not in [c["sentence"] for c in consequences]:
-                consequences.append({"sentence": sent.text.strip(), "method": "nlp"})
-
-    # --- 5. Extract entities ---
-    entities = []
-    for ent in doc.ents:
-        if ent.label_ in ["DATE", "MONEY", "ORG", "PERCENT"]:
-            entities.append({"text": ent.text, "label": ent.label_})
-    if re.search(r"\bpenalt(y|ies)\b|\bfine\b", merged_text, re.IGNORECASE):
+    for sent, sent_hits in zip(sentences, sentence_hits):
+        groups = {h[2] for h in sent_hits}
+
+        # --- Deadlines: sentences containing a deadline keyword ---
+        if "deadline" in groups:
+            deadlines.append({"sentence": sent})
+
+        # --- Consequences: ordered keyword rules, then penalty-word fallback ---
+        if any(has_sequence(sent_hits, rule) for rule in CONSEQUENCE_RULES):
+            consequences.append({"sentence": sent, "method": "regex"})
+        elif "consequence_word" in groups:
+            consequences.append({"sentence": sent, "method": "nlp"})
+
+    # --- Extract entities ---
+    text_groups = {h[2] for h in hits}
+    entities = [e for e in analysis["entities"] if e["label"] in ["DATE", "MONEY", "ORG", "PERCENT"]]
+    if "penalty_entity" in text_groups:
         entities.append({"text": merged_text, "label": "PENALTY"})
-    if re.search(r"\bshall\b|\bmust\b", merged_text, re.IGNORECASE):
+    if "obligation" in text_groups:
         entities.append({"text": merged_text, "label": "OBLIGATION"})
 
-    # --- 6. Extract references ---
-    references = []
-    clause_pattern = re.findall(r"(Clause\s+\d+(\.\d+)*)", merged_text, re.IGNORECASE)
-    section_pattern = re.findall(r"(Section\s+\d+(\.\d+)*)", merged_text, re.IGNORECASE)
-    for c in clause_pattern:
-        references.append(c[0])
-    for s in section_pattern:
-        references.append(s[0])
-
     return {
         "entities": entities,
-        "references": references,
+        "references": analysis["references"],
         "deadlines": deadlines,
         "consequences": consequences
     }
+
+def extract_entities_and_deadlines_batch(texts, n_process=None, batch_size=None):
+    """
+    Batched extract_entities_and_deadlines: one nlp.pipe pass over all texts.
+    """
+    return [_extract_from_analysis(a) for a in analyze_batch(texts, n_process=n_process, batch_size=batch_size)]
+
+def extract_entities_and_deadlines(text: str):
+    """
+    Extract full sentences for deadlines, consequences, entities, and references.
+    - Ensures sentences are merged properly (no mid-line splits)
+    - Consequences captured with ordered keyword rules + penalty-word fallback
+    - Deadlines captured as full sentences containing keywords
+    """
+    return extract_entities_and_deadlines_batch([text])[0]
@@ -0,0 +1,315 @@
+# app/utils/ingest_jobs.py
+import os
+import json
+import time
+import uuid
+import queue
+import logging
+import threading
+from app.config import (
+    INGEST_WORKERS, INGEST_QUEUE_MAX, INGEST_JOBS_DIR,
+    INGEST_JOB_RETENTION_SECONDS, INGEST_JOB_SWEEP_SECONDS
+)
+
+# ----------------------------------------------------------------------
+# Background ingestion jobs
+# ----------------------------------------------------------------------
+# /ingest saves the upload, enqueues a job and returns its id. A fixed pool of
+# worker threads takes jobs by priority (lower first, then FIFO). Every state
+# change is written to INGEST_JOBS_DIR/<id>.json (write + rename), so on restart
+# queued and interrupted jobs are picked up again; pages finished before the
+# restart come back from the OCR result cache.
+# Several API processes can share INGEST_JOBS_DIR: a job belongs to the process
+# holding its <id>.lock (created O_EXCL, containing the owner's pid), and only
+# jobs whose owner is gone are resumed, once, by whichever process claims them.
+# Only queued/running jobs stay in memory; finished ones are read back from
+# their file, which is deleted after INGEST_JOB_RETENTION_SECONDS.
+
+logger = logging.getLogger("ingest_jobs")
+PROGRESS_SAVE_SECONDS = 2.0
+TERMINAL_STATUSES = ("done", "failed")
+
+class QueueFull(Exception):
+    pass
+
+def _owner_alive(lock_path):
+    """Whether the pid recorded in a job lock file is a running process."""
+    try:
+        with open(lock_path, encoding="utf-8") as f:
+            content = f.read().strip()
+    except FileNotFoundError:
+        return False
+    except OSError:
+        return True
+    if not content:
+        return True  # just created, pid not written yet
+    try:
+        pid = int(content)
+    except ValueError:
+        return False
+    if pid == os.getpid():
+        return False  # left over from a previous process that had our pid
+    if os.name == "nt":
+        return True  # os.kill would terminate it; never take over a job here
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class IngestJobQueue:
+    def __init__(self, jobs_dir, workers=1, max_queued=100,
+                 retention_seconds=INGEST_JOB_RETENTION_SECONDS, sweep_seconds=INGEST_JOB_SWEEP_SECONDS):
+        self.jobs_dir = jobs_dir
+        self.workers = workers
+        self.max_queued = max_queued
+        self.retention_seconds = retention_seconds
+        self.sweep_seconds = sweep_seconds
+        self._queue = queue.PriorityQueue()
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._handler = None
+        self._threads = []
+        self._saved_at = {}
+        self._finished = {status: 0 for status in TERMINAL_STATUSES}
+        os.makedirs(jobs_dir, exist_ok=True)
+
+    # -------------------------
+    # Persistence
+    # -------------------------
+    def _path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _save(self, job):
+        path = self._path(job["job_id"])
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, path)
+
+    def _lock_path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.lock")
+
+    def _claim(self, job_id):
+        """Takes ownership of a job; False if a live process already owns it."""
+        path = self._lock_path(job_id)
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if _owner_alive(path):
+                    return False
+                try:
+                    os.remove(path)  # owner died; retry the exclusive create
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, "w") as f:
+                f.write(str(os.getpid()))
+            return True
+        return False
+
+    def _release(self, job_id):
+        try:
+            os.remove(self._lock_path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return json.loads(json.dumps(job, default=str))
+        path = self._path(job_id)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        return None
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(fields)
+            job["updated_at"] = time.time()
+            self._save(job)
+
+    # -------------------------
+    # Queue
+    # -------------------------
+    def _enqueue(self, job):
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+        self._queue.put((job["priority"], seq, job["job_id"]))
+
+    def submit(self, params, priority=5):
+        """Persists a new job and queues it. Raises QueueFull past max_queued."""
+        if self._queue.qsize() >= self.max_queued:
+            raise QueueFull(f"{self._queue.qsize()} ingestion jobs already queued")
+        now = time.time()
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": "queued",
+            "priority": priority,
+            "params": params,
+            "attempts": 0,
+            "created_at": now,
+            "updated_at": now,
+            "started_at": None,
+            "finished_at": None,
+            "progress": {"pages_done": 0, "pages_total": None},
+            "pages": [],
+            "result": None,
+            "error": None
+        }
+        self._claim(job["job_id"])
+        with self._lock:
+            self._jobs[job["job_id"]] = job
+            self._save(job)
+        self._enqueue(job)
+        return job["job_id"]
+
+    def page_done(self, job_id, page, done, total):
+        """
+        Progress callback: records one finished page's counts, lang and source
+        (text is served by /ingest/jobs/{id}/pages/{n}). The job file is
+        rewritten at most every PROGRESS_SAVE_SECONDS, and on the last page.
+        """
+        with self._lock:
+            job = self._jobs[job_id]
+            job["progress"] = {"pages_done": done, "pages_total": total}
+            job["pages"].append({
+                "page_number": page.get("page_number"),
+                "lang": page.get("lang"),
+                "source": page.get("source"),
+                "lines": len(page.get("lines", []))
+            })
+            now = time.time()
+            job["updated_at"] = now
+            if done == total or now - self._saved_at.get(job_id, 0) >= PROGRESS_SAVE_SECONDS:
+                self._save(job)
+                self._saved_at[job_id] = now
+
+    def _work(self):
+        while True:
+            _, _, job_id = self._queue.get()
+            try:
+                with self._lock:
+                    job = self._jobs[job_id]
+                    job.update({"status": "running", "started_at": time.time(), "attempts": job["attempts"] + 1,
+                                "pages": [], "progress": {"pages_done": 0, "pages_total": None}})
+                    self._save(job)
+                result = self._handler(job_id, dict(job["params"]))
+                self.update(job_id, status="done", result=result, finished_at=time.time())
+            except Exception as e:
+                logger.exception(f"Ingestion job {job_id} failed")
+                self.update(job_id, status="failed", error=str(e), finished_at=time.time())
+            finally:
+                # Terminal state is on disk now; get() reads it from there
+                with self._lock:
+                    job = self._jobs.pop(job_id, None)
+                    if job is not None and job["status"] in self._finished:
+                        self._finished[job["status"]] += 1
+                self._saved_at.pop(job_id, None)
+                self._release(job_id)
+                self._queue.task_done()
+
+    # -------------------------
+    # Retention
+    # -------------------------
+    def sweep(self):
+        """
+        Deletes finished/failed job files older than retention_seconds, and
+        .lock files whose owner is gone and whose job is finished or missing
+        (locks of unfinished jobs are left for start() to resume).
+        """
+        cutoff = time.time() - self.retention_seconds
+        removed = 0
+        for name in os.listdir(self.jobs_dir):
+            path = os.path.join(self.jobs_dir, name)
+            job_id, ext = os.path.splitext(name)
+            try:
+                if ext == ".json":
+                    with open(path, encoding="utf-8") as f:
+                        job = json.load(f)
+                    if job.get("status") in TERMINAL_STATUSES and (job.get("finished_at") or 0) < cutoff:
+                        os.remove(path)
+                        self._release(job_id)
+                        removed += 1
+                elif ext == ".lock":
+                    if _owner_alive(path):
+                        continue
+                    with self._lock:
+                        if job_id in self._jobs:
+                            continue
+                    job = self.get(job_id)
+                    if job is None or job.get("status") in TERMINAL_STATUSES:
+                        os.remove(path)
+                elif ext == ".tmp" and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except (OSError, ValueError):
+                continue
+        if removed:
+            logger.info(f"Removed {removed} expired ingestion job(s)")
+        return removed
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self.sweep_seconds)
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Ingestion job sweep failed")
+
+    def start(self, handler):
+        """Starts the workers and re-queues jobs left queued or running by a process that is gone."""
+        if self._threads:
+            return
+        self._handler = handler
+        self.sweep()
+        resumed = []
+        for name in sorted(os.listdir(self.jobs_dir)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.jobs_dir, name), encoding="utf-8") as f:
+                    job = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if job.get("status") not in ("queued", "running") or not self._claim(job["job_id"]):
+                continue
+            # Re-read under the claim: the previous owner may have finished it meanwhile
+            job = self.get(job["job_id"])
+            if job is None or job.get("status") not in ("queued", "running"):
+                self._release(name[:-len(".json")])
+                continue
+            job["status"] = "queued"
+            with self._lock:
+                self._jobs[job["job_id"]] = job
+                self._save(job)
+            resumed.append(job)
+        for job in sorted(resumed, key=lambda j: (j["priority"], j["created_at"])):
+            self._enqueue(job)
+        if resumed:
+            logger.info(f"Resumed {len(resumed)} ingestion job(s)")
+
+        for i in range(self.workers):
+            t = threading.Thread(target=self._work, name=f"ingest-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        t = threading.Thread(target=self._sweep_loop, name="ingest-job-sweeper", daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    def stats(self):
+        with self._lock:
+            # Unfinished jobs are in memory; finished ones are counted since start
+            counts = dict(self._finished)
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return {"workers": self.workers, "queued": self._queue.qsize(), "max_queued": self.max_queued, "jobs": counts}
+
+ingest_jobs = IngestJobQueue(INGEST_JOBS_DIR, workers=INGEST_WORKERS, max_queued=INGEST_QUEUE_MAX)
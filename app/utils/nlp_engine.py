@@ -0,0 +1,57 @@
+# app/utils/nlp_engine.py
+import re
+import spacy
+from app.config import NLP_N_PROCESS, NLP_BATCH_SIZE
+
+# One shared spaCy model for dead.py and nlp_tools.py.
+# en_core_web_sm's NER carries its own tok2vec, so everything except NER can be
+# excluded; a rule-based sentencizer replaces both NLTK punkt and the dependency parser.
+nlp = spacy.load(
+    "en_core_web_sm",
+    exclude=["tok2vec", "tagger", "parser", "attribute_ruler", "lemmatizer", "senter"]
+)
+nlp.add_pipe("sentencizer")
+
+reference_patterns = [
+    re.compile(r"(Clause\s+\d+(\.\d+)*)", re.IGNORECASE),
+    re.compile(r"(Section\s+\d+(\.\d+)*)", re.IGNORECASE),
+    re.compile(r"(Article\s+\d+(\.\d+)*)", re.IGNORECASE)
+]
+
+def merge_lines(text: str) -> str:
+    """Joins non-empty lines so sentences are not split at OCR/PDF line breaks."""
+    return " ".join(line.strip() for line in text.splitlines() if line.strip())
+
+def find_references(text: str):
+    """Clause/Section/Article references, grouped by kind in that order."""
+    refs = []
+    for pattern in reference_patterns:
+        refs.extend(m.group(1) for m in pattern.finditer(text))
+    return refs
+
+def analyze_batch(texts, n_process=None, batch_size=None):
+    """
+    Runs one nlp.pipe pass over a batch of chunks.
+    Returns, per chunk: merged text, sentences with (start, end) spans,
+    named entities and Clause/Section/Article references.
+    """
+    merged = [merge_lines(t or "") for t in texts]
+    docs = nlp.pipe(
+        merged,
+        n_process=n_process or NLP_N_PROCESS,
+        batch_size=batch_size or NLP_BATCH_SIZE
+    )
+
+    results = []
+    for text, doc in zip(merged, docs):
+        results.append({
+            "text": text,
+            "sentences": [s.text.strip() for s in doc.sents if s.text.strip()],
+            "sentence_spans": [(s.start_char, s.end_char) for s in doc.sents if s.text.strip()],
+            "entities": [{"text": ent.text, "label": ent.label_} for ent in doc.ents],
+            "references": find_references(text)
+        })
+    return results
+
+def analyze(text: str):
+    return analyze_batch([text])[0]
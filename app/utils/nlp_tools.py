@@ -1,40 +1,35 @@
 # app/utils/nlp_tools.py
-import spacy
-import re
+from app.utils.nlp_engine import analyze, find_references
+from app.utils.pattern_engine import legal_matcher
 
-nlp = spacy.load("en_core_web_sm")
+area_groups = [
+    ("area_privacy", "Privacy"),
+    ("area_security", "Security"),
+    ("area_reporting", "Reporting"),
+    ("area_integrity", "AML/Integrity"),
+]
 
-def classify_compliance_area(text: str) -> str:
-    text_lower = text.lower()
-    if any(k in text_lower for k in ["data protection", "gdpr", "personal data", "privacy"]):
-        return "Privacy"
-    elif any(k in text_lower for k in ["cybersecurity", "access control", "encryption", "security"]):
-        return "Security"
-    elif any(k in text_lower for k in ["report", "audit", "disclosure", "filing", "notify"]):
-        return "Reporting"
-    elif any(k in text_lower for k in ["anti-money laundering", "bribery", "fraud"]):
-        return "AML/Integrity"
-    else:
-        return "General Compliance"
+def classify_compliance_area(text: str, groups=None) -> str:
+    groups = legal_matcher.groups_in(text) if groups is None else groups
+    for group, area in area_groups:
+        if group in groups:
+            return area
+    return "General Compliance"
 
 def extract_entities(text: str):
-    doc = nlp(text)
     entities = []
-    for ent in doc.ents:
-        if ent.label_ in ["ORG", "LAW", "GPE"]:
-            entities.append({"text": ent.text, "label": "REGULATION_NAME"})
-    if re.search(r"\bmust\b|\bshall\b|\bshould\b|\brequired to\b|\bprohibited\b", text, re.IGNORECASE):
+    for ent in analyze(text)["entities"]:
+        if ent["label"] in ["ORG", "LAW", "GPE"]:
+            entities.append({"text": ent["text"], "label": "REGULATION_NAME"})
+    # One keyword scan serves the obligation, compliance-area and penalty checks
+    groups = legal_matcher.groups_in(text)
+    if "obligation_regulatory" in groups:
         entities.append({"text": text, "label": "OBLIGATION"})
-    compliance_area = classify_compliance_area(text)
+    compliance_area = classify_compliance_area(text, groups)
     entities.append({"text": text, "label": f"COMPLIANCE_AREA_{compliance_area.upper()}"} )
-    if re.search(r"\bpenalt(y|ies)\b|\bfine\b|\bimprisonment\b", text, re.IGNORECASE):
+    if "penalty_regulatory" in groups:
         entities.append({"text": text, "label": "PENALTY"})
     return entities
 
 def detect_references(text: str):
-    refs = []
-    clause_pattern = re.findall(r"(Clause\s+\d+(\.\d+)*)", text, re.IGNORECASE)
-    section_pattern = re.findall(r"(Section\s+\d+(\.\d+)*)", text, re.IGNORECASE)
-    refs.extend([c[0] for c in clause_pattern])
-    refs.extend([s[0] for s in section_pattern])
-    return refs
+    return find_references(text)
@@ -0,0 +1,180 @@
+# app/utils/pattern_engine.py
+import time
+from collections import deque
+
+# ----------------------------------------------------------------------
+# Linear-time multi-keyword matcher (Aho–Corasick)
+# ----------------------------------------------------------------------
+# Keywords are matched case-insensitively and must start on a word boundary.
+# A trailing "*" marks a prefix keyword ("penalt*" matches "penalty", "penalties");
+# without it the keyword must also end on a word boundary.
+# One scan costs O(len(text) + hits), whatever the number of keywords.
+
+def _is_word_char(ch):
+    return ch.isalnum() or ch == "_"
+
+def _fold(ch):
+    # Lower-case without changing string length, so match offsets stay valid
+    low = ch.lower()
+    return low if len(low) == 1 else ch
+
+class KeywordMatcher:
+    def __init__(self, groups):
+        """
+        groups: {group_name: [keyword, ...]}. A keyword may appear in several groups.
+        """
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+
+        for group, keywords in groups.items():
+            for kw in keywords:
+                prefix = kw.endswith("*")
+                word = "".join(_fold(c) for c in kw.rstrip("*"))
+                node = 0
+                for ch in word:
+                    if ch not in self.goto[node]:
+                        self.goto.append({})
+                        self.fail.append(0)
+                        self.out.append([])
+                        self.goto[node][ch] = len(self.goto) - 1
+                    node = self.goto[node][ch]
+                self.out[node].append((len(word), group, kw, prefix))
+
+        # Breadth-first failure links; outputs of the failure state are inherited
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self.goto[node].items():
+                queue.append(child)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[child] = self.goto[f].get(ch, 0)
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+
+    def finditer(self, text):
+        """Yields (start, end, group, keyword) for every boundary-respecting match."""
+        node = 0
+        n = len(text)
+        for i, raw in enumerate(text):
+            ch = _fold(raw)
+            while node and ch not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(ch, 0)
+            for length, group, kw, prefix in self.out[node]:
+                start = i - length + 1
+                if start > 0 and _is_word_char(text[start - 1]):
+                    continue
+                if not prefix and i + 1 < n and _is_word_char(text[i + 1]):
+                    continue
+                yield start, i + 1, group, kw
+
+    def findall(self, text):
+        return list(self.finditer(text))
+
+    def groups_in(self, text):
+        return {group for _, _, group, _ in self.finditer(text)}
+
+def has_sequence(hits, sequence):
+    """
+    Anchored confirmation: True if hits contain one match per group in
+    `sequence`, in order and non-overlapping. Greedy earliest-end is exact, O(len(hits)).
+    hits: (start, end, group, keyword) tuples sorted by end offset, as finditer yields them.
+    """
+    step, pos = 0, 0
+    for start, end, group, _ in hits:
+        if group == sequence[step] and start >= pos:
+            step, pos = step + 1, end
+            if step == len(sequence):
+                return True
+    return False
+
+def bucket_by_spans(hits, spans):
+    """Splits hits (sorted by end offset) into one list per (start, end) span, in one pass."""
+    buckets = [[] for _ in spans]
+    ordered = sorted(range(len(spans)), key=lambda i: spans[i][0])
+    j = 0
+    for hit in hits:
+        while j < len(ordered) and spans[ordered[j]][1] < hit[1]:
+            j += 1
+        if j < len(ordered) and spans[ordered[j]][0] <= hit[0]:
+            buckets[ordered[j]].append(hit)
+    return buckets
+
+# ----------------------------------------------------------------------
+# Shared keyword sets (dead.py, nlp_tools.py, prioritization.py, gap_detection.py)
+# ----------------------------------------------------------------------
+PENALTY_TERMS = ["penalt*", "interest", "termination", "damage*", "forfeit*", "liable"]
+
+legal_matcher = KeywordMatcher({
+    # Deadlines
+    "deadline": ["no later than", "on or before", "within", "by",
+                 "completion date", "delivery date", "due date"],
+    # Consequence rule 1: trigger ... penalty
+    "trigger": ["if", "should", "in case", "failure to", "breach*"],
+    "penalty": PENALTY_TERMS + ["compensation", "legal action"],
+    # Consequence rule 2: late ... will/shall/may ... result/lead ... penalty
+    "late": ["late", "delayed", "non-performance", "non performance", "nonperformance"],
+    "modal": ["will", "shall", "may"],
+    "outcome": ["result*", "lead*"],
+    "penalty_strict": PENALTY_TERMS,
+    # Penalty-word fallback
+    "consequence_word": ["penalty", "interest", "termination", "breach*",
+                         "damages", "liable", "compensation"],
+    # Entity flags
+    "penalty_entity": ["penalty", "penalties", "fine"],
+    "penalty_regulatory": ["penalty", "penalties", "fine", "imprisonment"],
+    "obligation": ["shall", "must"],
+    "obligation_regulatory": ["must", "shall", "should", "required to", "prohibited"],
+    # Compliance areas (classify_compliance_area checks them in this order)
+    "area_privacy": ["data protection*", "gdpr*", "personal data*", "privacy*"],
+    "area_security": ["cybersecurity*", "access control*", "encryption*", "security*"],
+    "area_reporting": ["report*", "audit*", "disclosure*", "filing*", "notify*"],
+    "area_integrity": ["anti-money laundering*", "bribery*", "fraud*"],
+    # Jurisdiction
+    "international": ["EU", "Europe", "European Union", "GDPR", "ISO"],
+    # Gap rules (gap_detection.py)
+    "eu_region": ["EU", "Europe", "European Union"],
+    "non_eu_region": ["us", "usa", "us-east-1", "us-west-2", "india", "ap-south-1"],
+    "encryption": ["encrypted", "TLS", "encryption at rest"],
+})
+
+CONSEQUENCE_RULES = [
+    ("trigger", "penalty"),
+    ("late", "modal", "outcome", "penalty_strict"),
+]
+
+# ----------------------------------------------------------------------
+# Benchmark: legacy lazy-wildcard regexes vs the matcher on pathological input
+# ----------------------------------------------------------------------
+if __name__ == "__main__":
+    import re
+
+    legacy_patterns = [
+        r"(?:if|should|in case|failure to|breach).*?(?:penalt(?:y|ies)|interest|termination|damages?|forfeit|liable|compensation|legal action).*?\.?",
+        r"(?:late|delayed|non[-\s]?performance).*?(?:will|shall|may).*?(?:result|lead).*?(?:penalt(?:y|ies)|interest|termination|damages?|forfeit|liable).*?\.?"
+    ]
+
+    def legacy(sent):
+        return any(re.search(p, sent, re.IGNORECASE) for p in legacy_patterns)
+
+    def engine(sent):
+        hits = legal_matcher.findall(sent)
+        return any(has_sequence(hits, rule) for rule in CONSEQUENCE_RULES)
+
+    print(f"{'input':<34}{'chars':>8}{'legacy ms':>12}{'engine ms':>12}")
+    # The legacy patterns grow roughly O(n^4) on near misses; 2000 chars already takes seconds
+    for size in (250, 500, 1000, 2000):
+        cases = {
+            "near-miss 'late will result'": "late will result " * (size // 17),
+            "trigger words, no penalty": "if the party should " * (size // 20),
+            "OCR run-on (no spaces)": "ifshouldlatewillresult" * (size // 22),
+        }
+        for name, sent in cases.items():
+            t0 = time.perf_counter()
+            legacy(sent)
+            t1 = time.perf_counter()
+            engine(sent)
+            t2 = time.perf_counter()
+            print(f"{name:<34}{len(sent):>8}{(t1 - t0) * 1000:>12.2f}{(t2 - t1) * 1000:>12.2f}")
@@ -1,4 +1,6 @@
 # app/utils/prioritization.py
+import re
+from app.utils.pattern_engine import legal_matcher
 
 # Example: priority mapping for jurisdictions
 priority_order = {
@@ -8,9 +10,9 @@ priority_order = {
 }
 
 def classify_jurisdiction(chunk_text, jurisdiction=None):
-    if jurisdiction and re.search(rf"\b{jurisdiction}\b", chunk_text, re.IGNORECASE):
+    if jurisdiction and re.search(rf"\b{re.escape(jurisdiction)}\b", chunk_text, re.IGNORECASE):
         return "local", 3
-    elif re.search(r"\b(EU|Europe|European Union|GDPR|ISO)\b", chunk_text, re.IGNORECASE):
+    elif "international" in legal_matcher.groups_in(chunk_text):
         return "international", 2
     else:
         return "company_policy", 1
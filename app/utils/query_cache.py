@@ -0,0 +1,186 @@
+# app/utils/query_cache.py
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import atexit
+import threading
+from collections import OrderedDict
+from contextlib import closing
+from app.config import QUERY_CACHE_ENABLED, QUERY_CACHE_PATH, QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_TTL
+
+# ----------------------------------------------------------------------
+# Query-result cache for /search and /rag
+# ----------------------------------------------------------------------
+# Entries live in a local SQLite file so every API worker shares them, with a
+# small per-process LRU in front. Keys include the corpus version, which
+# insert_chunk / insert_regulation_chunk bump on every write, so ingest
+# invalidates exactly the results that could have changed.
+# Lookups stay off the shared write lock: local LRU hits never touch SQLite,
+# shared-tier hits only refresh last_access, and hit/miss counters are summed
+# in memory and flushed at most every COUNTER_FLUSH_SECONDS.
+COUNTER_FLUSH_SECONDS = 5.0
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+class QueryCache:
+    def __init__(self, path, max_entries=1024, ttl_seconds=600, enabled=True):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._local = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._pending = {"hits": 0, "misses": 0}  # not yet flushed to the shared counters
+        self._flushed_at = time.time()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with closing(self._connect()) as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            db.executemany(
+                "INSERT OR IGNORE INTO counters (name, value) VALUES (?, 0)",
+                [("corpus_version",), ("hits",), ("misses",)]
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5, isolation_level=None)
+
+    def _counter(self, db, name):
+        return db.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()[0]
+
+    def _incr(self, db, name, by=1):
+        db.execute("UPDATE counters SET value = value + ? WHERE name = ?", (by, name))
+
+    def _count(self, name):
+        with self._lock:
+            self._pending[name] += 1
+            due = time.time() - self._flushed_at >= COUNTER_FLUSH_SECONDS
+        if due:
+            self.flush_counters()
+
+    def flush_counters(self):
+        """Adds this process's pending hit/miss counts to the shared counters."""
+        with self._lock:
+            pending, self._pending = self._pending, {"hits": 0, "misses": 0}
+            self._flushed_at = time.time()
+        if not any(pending.values()):
+            return
+        with closing(self._connect()) as db:
+            for name, n in pending.items():
+                if n:
+                    self._incr(db, name, n)
+
+    # -------------------------
+    # Corpus version
+    # -------------------------
+    def corpus_version(self):
+        with closing(self._connect()) as db:
+            return self._counter(db, "corpus_version")
+
+    def bump_corpus_version(self):
+        """Called after every chunk write; drops entries that can no longer be hit."""
+        with closing(self._connect()) as db:
+            self._incr(db, "corpus_version")
+            db.execute("DELETE FROM entries")
+        with self._lock:
+            self._local.clear()
+
+    # -------------------------
+    # Lookup / store
+    # -------------------------
+    def make_key(self, namespace, query, **params):
+        payload = {
+            "ns": namespace,
+            "query": normalize_query(query),
+            "corpus_version": self.corpus_version(),
+            **params
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        now = time.time()
+
+        with self._lock:
+            entry = self._local.get(key)
+            if entry and entry[0] > now:
+                self._local.move_to_end(key)
+                value = entry[1]
+            else:
+                self._local.pop(key, None)
+                value = None
+
+        if value is None:
+            with closing(self._connect()) as db:
+                row = db.execute(
+                    "SELECT value, expires_at FROM entries WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+                if row:
+                    value = json.loads(row[0])
+                    self._remember(key, row[1], value)
+                    db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+        self._count("misses" if value is None else "hits")
+        return value
+
+    def set(self, key, value):
+        if not self.enabled:
+            return
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        with closing(self._connect()) as db:
+            db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, default=str), expires_at, now)
+            )
+            # TTL first, then least-recently-used beyond max_entries
+            db.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+            db.execute("""
+                DELETE FROM entries WHERE key IN (
+                    SELECT key FROM entries ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+        self._remember(key, expires_at, value)
+
+    def _remember(self, key, expires_at, value):
+        with self._lock:
+            self._local[key] = (expires_at, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    def stats(self):
+        self.flush_counters()
+        with closing(self._connect()) as db:
+            hits = self._counter(db, "hits")
+            misses = self._counter(db, "misses")
+            return {
+                "enabled": self.enabled,
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+                "entries": db.execute("SELECT COUNT(*) FROM entries").fetchone()[0],
+                "corpus_version": self._counter(db, "corpus_version"),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds
+            }
+
+query_cache = QueryCache(
+    QUERY_CACHE_PATH,
+    max_entries=QUERY_CACHE_MAX_ENTRIES,
+    ttl_seconds=QUERY_CACHE_TTL,
+    enabled=QUERY_CACHE_ENABLED
+)
+atexit.register(query_cache.flush_counters)
@@ -0,0 +1,124 @@
+# app/utils/reranking.py
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from sentence_transformers import CrossEncoder
+from app.config import RERANK_MODEL, RERANK_BUDGET_MS, RERANK_CACHE_SIZE
+
+# ----------------------------------------------------------------------
+# Cross-encoder re-ranking (shared by /search and /rag)
+# ----------------------------------------------------------------------
+# All uncached (query, chunk) pairs are scored in one batched forward pass.
+# Pair scores are cached by (query hash, text_hash). If the pass is predicted
+# to exceed the latency budget, or actually does, the caller keeps vector order.
+# Every RERANK_PROBE_EVERY predicted fallbacks a few pairs are scored anyway to
+# re-measure the per-pair cost, so one slow pass (cold start, a noisy
+# neighbour) cannot switch re-ranking off for the life of the process.
+# The cost estimate and probe counter are shared by all request threads and
+# only touched under _stats_lock.
+RERANK_PROBE_EVERY = 20
+RERANK_PROBE_PAIRS = 4
+
+_cross_encoder = None
+_model_lock = threading.Lock()
+_cache_lock = threading.Lock()
+_score_cache = OrderedDict()   # (query_hash, text_hash) -> score
+_seconds_per_pair = None       # moving average, drives the budget prediction
+_skipped_since_probe = 0
+_stats_lock = threading.Lock()
+
+def get_cross_encoder():
+    global _cross_encoder
+    with _model_lock:
+        if _cross_encoder is None:
+            _cross_encoder = CrossEncoder(RERANK_MODEL, device="cpu")
+            print(f"✅ Re-ranker loaded: {RERANK_MODEL}")
+    return _cross_encoder
+
+def _hash(text):
+    return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+def _score(query, candidates, text_of, indices, keys, scores):
+    """Scores candidates[indices] in one batch, caching the results. Returns elapsed seconds."""
+    encoder = get_cross_encoder()
+    start = time.perf_counter()
+    predicted = encoder.predict(
+        [(query, text_of(candidates[i])) for i in indices],
+        batch_size=len(indices),
+        show_progress_bar=False
+    )
+    elapsed = time.perf_counter() - start
+    with _cache_lock:
+        for i, score in zip(indices, predicted):
+            _score_cache[keys[i]] = float(score)
+            scores[keys[i]] = float(score)
+        while len(_score_cache) > RERANK_CACHE_SIZE:
+            _score_cache.popitem(last=False)
+    return elapsed
+
+def rerank(query, candidates, text_of, budget_ms=None):
+    """
+    Reorders candidates by cross-encoder relevance to `query`.
+    text_of(candidate) returns the chunk text. Returns (candidates, info); on
+    fallback the input order is returned unchanged and info["reranked"] is False.
+    """
+    global _seconds_per_pair, _skipped_since_probe
+    budget = (budget_ms if budget_ms is not None else RERANK_BUDGET_MS) / 1000.0
+    info = {"reranked": False, "scored_pairs": 0, "cached_pairs": 0, "elapsed_ms": 0.0}
+    if not candidates:
+        return candidates, info
+
+    query_hash = _hash(" ".join(query.lower().split()))
+    keys = [(query_hash, _hash(text_of(c))) for c in candidates]
+
+    with _cache_lock:
+        scores = {k: _score_cache[k] for k in keys if k in _score_cache}
+        for k in scores:
+            _score_cache.move_to_end(k)
+    missing = [i for i, k in enumerate(keys) if k not in scores]
+    info["cached_pairs"] = len(candidates) - len(missing)
+
+    spent = 0.0
+    probing = False
+    with _stats_lock:
+        if missing and _seconds_per_pair is not None and _seconds_per_pair * len(missing) > budget:
+            _skipped_since_probe += 1
+            if _skipped_since_probe < RERANK_PROBE_EVERY:
+                info["fallback"] = "predicted_over_budget"
+                return candidates, info
+            _skipped_since_probe = 0
+            probing = True
+    if probing:
+        # Probe: the estimate is only refreshed by real passes, so take a small one
+        probe, missing = missing[:RERANK_PROBE_PAIRS], missing[RERANK_PROBE_PAIRS:]
+        spent = _score(query, candidates, text_of, probe, keys, scores)
+        per_pair = spent / len(probe)
+        with _stats_lock:
+            _seconds_per_pair = per_pair
+        info.update({"probe_pairs": len(probe), "scored_pairs": len(probe), "elapsed_ms": spent * 1000})
+        if missing and spent + per_pair * len(missing) > budget:
+            info["fallback"] = "predicted_over_budget"
+            return candidates, info
+
+    if missing:
+        elapsed = _score(query, candidates, text_of, missing, keys, scores)
+        spent += elapsed
+        info["elapsed_ms"] = spent * 1000
+        info["scored_pairs"] += len(missing)
+
+        per_pair = elapsed / len(missing)
+        with _stats_lock:
+            _seconds_per_pair = per_pair if _seconds_per_pair is None else 0.8 * _seconds_per_pair + 0.2 * per_pair
+
+    # Scores are cached for next time, but this request already overran
+    if spent > budget:
+        info["fallback"] = "over_budget"
+        return candidates, info
+
+    for c, k in zip(candidates, keys):
+        if isinstance(c, dict):
+            c["rerank_score"] = scores[k]
+    info["reranked"] = True
+    ranked = sorted(zip(candidates, keys), key=lambda ck: -scores[ck[1]])
+    return [c for c, _ in ranked], info
@@ -0,0 +1,221 @@
+# app/utils/retrieval.py
+import time
+from app.db.connection import conn
+from app.db.extractions import get_or_extract
+from app.config import DISTANCE_THRESHOLD, RRF_K, HYBRID_CANDIDATE_MULTIPLIER
+from app.utils.prioritization import priority_order
+from app.utils.nlp_engine import find_references
+from app.utils.reranking import rerank
+
+# -------------------------
+# Candidate retrieval (shared by /search and /rag)
+# -------------------------
+VECTOR_SQL = """
+    SELECT chunk_text, metadata, embedding <-> %(emb)s::vector AS distance,
+           NULL::float AS score, FALSE AS lexical_hit
+    FROM document_chunks
+    ORDER BY embedding <-> %(emb)s::vector
+    LIMIT %(limit)s;
+"""
+
+# Vector ANN list and full-text list, fused by reciprocal-rank fusion in one statement.
+# The free-text query is OR-ed term by term; detected statutory references
+# ("Article 17", "Section 4.2") are added as exact phrases. Matching and ranking
+# use the stored chunk_tsv column (GIN-indexed, see create_search_indexes).
+HYBRID_SQL = """
+    WITH vec AS (
+        SELECT id, ROW_NUMBER() OVER (ORDER BY dist) AS rnk
+        FROM (
+            SELECT id, embedding <-> %(emb)s::vector AS dist
+            FROM document_chunks
+            ORDER BY embedding <-> %(emb)s::vector
+            LIMIT %(limit)s
+        ) v
+    ),
+    lex AS (
+        SELECT id, ROW_NUMBER() OVER (ORDER BY lex_rank DESC) AS rnk
+        FROM (
+            SELECT id, ts_rank_cd(chunk_tsv, tsq) AS lex_rank
+            FROM document_chunks,
+                 (SELECT replace(plainto_tsquery('english', %(query)s)::text, ' & ', ' | ')::tsquery
+                         || websearch_to_tsquery('english', %(refs)s) AS tsq) q
+            WHERE chunk_tsv @@ tsq
+            ORDER BY lex_rank DESC
+            LIMIT %(limit)s
+        ) l
+    ),
+    fused AS (
+        SELECT COALESCE(vec.id, lex.id) AS id,
+               COALESCE(%(vector_weight)s / (%(rrf_k)s + vec.rnk), 0)
+             + COALESCE(%(lexical_weight)s / (%(rrf_k)s + lex.rnk), 0) AS score,
+               lex.id IS NOT NULL AS lexical_hit
+        FROM vec FULL OUTER JOIN lex ON vec.id = lex.id
+    )
+    SELECT d.chunk_text, d.metadata, d.embedding <-> %(emb)s::vector AS distance,
+           f.score, f.lexical_hit
+    FROM fused f
+    JOIN document_chunks d ON d.id = f.id
+    ORDER BY f.score DESC
+    LIMIT %(limit)s;
+"""
+
+# One statement for many queries: each query vector gets its own top-k via LATERAL
+BATCH_VECTOR_SQL = """
+    SELECT q.ord, d.chunk_text, d.metadata, d.distance, NULL::float AS score, FALSE AS lexical_hit
+    FROM unnest(%(embs)s::text[]) WITH ORDINALITY AS q(emb, ord)
+    CROSS JOIN LATERAL (
+        SELECT chunk_text, metadata, embedding <-> q.emb::vector AS distance
+        FROM document_chunks
+        ORDER BY embedding <-> q.emb::vector
+        LIMIT %(limit)s
+    ) d
+    ORDER BY q.ord, d.distance;
+"""
+
+def to_vector_literal(embedding):
+    return "[" + ",".join(str(x) for x in embedding) + "]"
+
+# Hybrid mode needs document_chunks.chunk_tsv (python -m app.db.create_tables
+# --search-indexes). Until it exists, hybrid requests run vector-only; a missing
+# column is re-checked every LEXICAL_RECHECK_SECONDS.
+LEXICAL_RECHECK_SECONDS = 60
+_lexical_ready = False
+_lexical_checked_at = 0.0
+
+def lexical_index_ready():
+    global _lexical_ready, _lexical_checked_at
+    if _lexical_ready or time.time() - _lexical_checked_at < LEXICAL_RECHECK_SECONDS:
+        return _lexical_ready
+    _lexical_checked_at = time.time()
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'document_chunks' AND column_name = 'chunk_tsv';
+        """)
+        _lexical_ready = cur.fetchone() is not None
+    if not _lexical_ready:
+        print("⚠️ document_chunks.chunk_tsv missing; hybrid search runs vector-only "
+              "(run: python -m app.db.create_tables --search-indexes)")
+    return _lexical_ready
+
+def resolve_mode(mode):
+    """The retrieval mode a request will actually get ("hybrid" -> "vector" until chunk_tsv exists)."""
+    return "vector" if mode == "hybrid" and not lexical_index_ready() else mode
+
+def fetch_candidates(query, query_embedding_str, top_k, mode="vector",
+                     vector_weight=1.0, lexical_weight=1.0):
+    """
+    Returns candidate rows (chunk_text, metadata, distance, score, lexical_hit).
+    mode="vector" keeps the plain embedding search; mode="hybrid" fuses it with
+    full-text search (vector-only until the search-index migration has run).
+    """
+    if mode == "hybrid" and lexical_index_ready():
+        refs = " or ".join(f'"{r}"' for r in find_references(query))
+        params = {
+            "emb": query_embedding_str,
+            "query": query,
+            "refs": refs,
+            "limit": top_k * HYBRID_CANDIDATE_MULTIPLIER,
+            "vector_weight": float(vector_weight),
+            "lexical_weight": float(lexical_weight),
+            "rrf_k": RRF_K
+        }
+        sql = HYBRID_SQL
+    else:
+        params = {"emb": query_embedding_str, "limit": top_k * 5}
+        sql = VECTOR_SQL
+
+    with conn.cursor() as cur:
+        cur.execute(sql, params)
+        return cur.fetchall()
+
+def fetch_candidates_batch(query_embedding_strs, top_k):
+    """
+    Vector candidates for many queries in one round trip.
+    Returns one row list per query, in input order.
+    """
+    grouped = [[] for _ in query_embedding_strs]
+    if not query_embedding_strs:
+        return grouped
+    with conn.cursor() as cur:
+        cur.execute(BATCH_VECTOR_SQL, {"embs": list(query_embedding_strs), "limit": top_k * 5})
+        for ord_, *row in cur.fetchall():
+            grouped[ord_ - 1].append(tuple(row))
+    return grouped
+
+def attach_extractions(results):
+    """Attaches the extraction persisted at ingest (computed only for chunks missing it)."""
+    extractions = get_or_extract([(r["chunk_text"], r["metadata"].pop("text_hash")) for r in results])
+    for r, extracted_info in zip(results, extractions):
+        r["metadata"].update({
+            "deadlines": extracted_info.get("deadlines", []),
+            "consequences": extracted_info.get("consequences", []),
+            "entities": extracted_info.get("entities", []),
+            "references": extracted_info.get("references", [])
+        })
+    return results
+
+def select_results(rows, jurisdiction, top_k, rerank_query=None, with_extractions=True):
+    """
+    Deduplicates, filters by jurisdiction and distance, ranks by priority and
+    attaches the extraction persisted at ingest.
+    Lexical hits are exempt from the distance threshold: an exact reference
+    match is relevant even when its embedding is far from the query.
+    With rerank_query, candidates are re-ranked by the cross-encoder within each
+    priority level. Returns (results, rerank info or None).
+    with_extractions=False leaves metadata["text_hash"] in place for a later
+    attach_extractions call (used to batch extraction lookups across queries).
+    """
+    seen_hashes = set()
+    results = []
+
+    for chunk_text, meta, distance, score, lexical_hit in rows:
+        distance = float(distance)
+
+        # Deduplication
+        text_hash = meta.get("text_hash")
+        if text_hash in seen_hashes:
+            continue
+        seen_hashes.add(text_hash)
+
+        # Jurisdiction filter
+        chunk_jurisdiction = meta.get("jurisdiction", "company")
+        if jurisdiction and chunk_jurisdiction != jurisdiction:
+            continue
+
+        # Distance threshold filter
+        if distance > DISTANCE_THRESHOLD and not lexical_hit:
+            continue
+
+        result = {
+            "chunk_text": chunk_text,
+            "metadata": {
+                "file_name": meta.get("file_name"),
+                "page": meta.get("page"),
+                "chunk_index": meta.get("chunk_index"),
+                "doc_type": meta.get("doc_type"),
+                "jurisdiction": chunk_jurisdiction,
+                "text_hash": text_hash
+            },
+            "distance": distance,
+            "priority": priority_order.get(chunk_jurisdiction, 3)
+        }
+        if score is not None:
+            result["score"] = float(score)
+        results.append(result)
+
+    # Sort by priority, then fused score (hybrid) or distance (vector)
+    results = sorted(
+        results, key=lambda x: (x["priority"], -x["score"] if "score" in x else x["distance"])
+    )
+
+    rerank_info = None
+    if rerank_query:
+        results, rerank_info = rerank(rerank_query, results, lambda r: r["chunk_text"])
+        # Stable sort keeps cross-encoder order within each priority level
+        results = sorted(results, key=lambda x: x["priority"])
+    results = results[:top_k]
+
+    if with_extractions:
+        attach_extractions(results)
+    return results, rerank_info
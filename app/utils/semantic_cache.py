@@ -0,0 +1,84 @@
+# app/utils/semantic_cache.py
+import threading
+import numpy as np
+from app.config import SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_RADIUS, SEMANTIC_CACHE_SIZE
+
+# ----------------------------------------------------------------------
+# Semantic answer cache for /rag
+# ----------------------------------------------------------------------
+# Reuses an LLM answer when a new query embeds within SEMANTIC_CACHE_RADIUS
+# (cosine distance) of a cached one AND retrieval returned exactly the same
+# context chunks. Chunks are identified by text_hash (a content hash), so an
+# answer can never be served once any chunk behind it has changed.
+#
+# The index is a fixed-size matrix of unit vectors scanned with one
+# matrix-vector product: at a few thousand entries that is both exact and
+# faster than building an approximate structure.
+
+class SemanticAnswerCache:
+    def __init__(self, capacity=2048, radius=0.1, enabled=True):
+        self.capacity = capacity
+        self.radius = radius
+        self.enabled = enabled
+        self._vectors = None            # (capacity, dim) unit vectors
+        self._entries = [None] * capacity
+        self._next = 0                  # ring-buffer slot to overwrite next
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _unit(embedding):
+        v = np.asarray(embedding, dtype=np.float32).ravel()
+        return v / (np.linalg.norm(v) + 1e-10)
+
+    def lookup(self, query_embedding, context_ids):
+        """Returns the cached answer for a near-identical query over the same context, else None."""
+        if not self.enabled:
+            return None
+        q = self._unit(query_embedding)
+        context_ids = frozenset(context_ids)
+
+        with self._lock:
+            if self._vectors is not None:
+                distances = 1.0 - self._vectors @ q
+                for i in np.argsort(distances):
+                    if distances[i] > self.radius:
+                        break
+                    entry = self._entries[i]
+                    if entry is not None and entry["context_ids"] == context_ids:
+                        self.hits += 1
+                        return entry["answer"]
+            self.misses += 1
+        return None
+
+    def add(self, query_embedding, context_ids, answer):
+        if not self.enabled:
+            return
+        q = self._unit(query_embedding)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.capacity, q.shape[0]), dtype=np.float32)
+            slot = self._next
+            self._vectors[slot] = q
+            self._entries[slot] = {"context_ids": frozenset(context_ids), "answer": answer}
+            self._next = (slot + 1) % self.capacity
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": sum(e is not None for e in self._entries),
+                "capacity": self.capacity,
+                "radius": self.radius
+            }
+
+semantic_cache = SemanticAnswerCache(
+    capacity=SEMANTIC_CACHE_SIZE,
+    radius=SEMANTIC_CACHE_RADIUS,
+    enabled=SEMANTIC_CACHE_ENABLED
+)
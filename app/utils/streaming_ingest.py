@@ -0,0 +1,150 @@
+# app/utils/streaming_ingest.py
+import time
+import queue
+import logging
+import threading
+from app.config import (
+    CHUNK_SIZE, CHUNK_OVERLAP,
+    INGEST_EMBED_BATCH_SIZE, INGEST_INSERT_BATCH_SIZE, INGEST_STAGE_QUEUE_SIZE
+)
+from app.models.embeddings import model
+from app.utils.text_cleaning import chunk_page_text
+from app.db.queries import insert_chunks_bulk
+
+# ----------------------------------------------------------------------
+# Streaming index stage for /ingest
+# ----------------------------------------------------------------------
+# OCR pages are fed in as they finish:
+#   feed(page) -> [pages queue] -> clean + chunk + batched encode
+#              -> [batches queue] -> bulk insert (insert_chunks_bulk)
+# Both queues are bounded, so a slow stage applies back-pressure to OCR and
+# memory stays flat however many pages the document has. Embedding starts on
+# the first page while later pages are still being OCR'd, and each insert
+# batch is searchable as soon as it lands.
+
+logger = logging.getLogger("streaming_ingest")
+_DONE = object()
+
+class StreamingIndexer:
+    def __init__(self, file_name, table="document_chunks", doc_type=None, jurisdiction="company",
+                 extra_metadata=None, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+        self.file_name = file_name
+        self.table = table
+        self.base_metadata = {"file_name": file_name, "doc_type": doc_type, "jurisdiction": jurisdiction,
+                              **(extra_metadata or {})}
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self._pages = queue.Queue(maxsize=INGEST_STAGE_QUEUE_SIZE)
+        self._batches = queue.Queue(maxsize=INGEST_STAGE_QUEUE_SIZE)
+        self._error = None
+        self._chunk_index = 0
+        self._start = time.perf_counter()
+        self.stats = {
+            "table": table, "pages": 0, "chunks": 0, "inserted": 0,
+            "embed_seconds": 0.0, "insert_seconds": 0.0,
+            "first_insert_after_seconds": None, "total_seconds": None
+        }
+        self._threads = [
+            threading.Thread(target=self._embed_stage, name="ingest-embed", daemon=True),
+            threading.Thread(target=self._insert_stage, name="ingest-insert", daemon=True)
+        ]
+        for t in self._threads:
+            t.start()
+
+    # -------------------------
+    # Producer side
+    # -------------------------
+    def feed(self, page):
+        """Queues one OCR page entry; blocks while the pipeline is full."""
+        if self._error:
+            raise self._error
+        self._pages.put(page)
+
+    def close(self):
+        """Flushes every stage and returns the stats; re-raises a stage failure."""
+        self._pages.put(_DONE)
+        for t in self._threads:
+            t.join()
+        self.stats["total_seconds"] = round(time.perf_counter() - self._start, 3)
+        if self._error:
+            raise self._error
+        return self.stats
+
+    def run(self, pages):
+        """Consumes an iterable of OCR page entries (e.g. a generator) end to end."""
+        for page in pages:
+            self.feed(page)
+        return self.close()
+
+    # -------------------------
+    # Stages
+    # -------------------------
+    def _fail(self, stage, e):
+        logger.exception(f"Streaming ingest {stage} stage failed for {self.file_name}")
+        self._error = self._error or e
+
+    def _embed_stage(self):
+        pending, done = [], False
+        try:
+            while True:
+                page = self._pages.get()
+                if page is _DONE:
+                    done = True
+                    break
+                if self._error:
+                    continue  # keep draining so feed() never blocks
+                text = " ".join(l.get("text", "") for l in page.get("lines", []) if l.get("text"))
+                for chunk in chunk_page_text(text, page.get("page_number"), self.chunk_size, self.overlap):
+                    chunk["chunk_index"] = self._chunk_index
+                    self._chunk_index += 1
+                    pending.append(chunk)
+                self.stats["pages"] += 1
+                while len(pending) >= INGEST_EMBED_BATCH_SIZE:
+                    self._encode(pending[:INGEST_EMBED_BATCH_SIZE])
+                    pending = pending[INGEST_EMBED_BATCH_SIZE:]
+            if pending and not self._error:
+                self._encode(pending)
+        except Exception as e:
+            self._fail("embed", e)
+            while not done:
+                done = self._pages.get() is _DONE
+        finally:
+            self._batches.put(_DONE)
+
+    def _encode(self, chunks):
+        start = time.perf_counter()
+        embeddings = model.encode([c["text"] for c in chunks], batch_size=len(chunks), show_progress_bar=False)
+        self.stats["embed_seconds"] += time.perf_counter() - start
+        self.stats["chunks"] += len(chunks)
+        self._batches.put([
+            (c["text"], emb.tolist(), {**self.base_metadata, "page": c["page"], "chunk_index": c["chunk_index"]})
+            for c, emb in zip(chunks, embeddings)
+        ])
+
+    def _insert_stage(self):
+        buffer, done = [], False
+        try:
+            while True:
+                batch = self._batches.get()
+                if batch is _DONE:
+                    done = True
+                    break
+                if self._error:
+                    continue
+                buffer.extend(batch)
+                if len(buffer) >= INGEST_INSERT_BATCH_SIZE:
+                    self._flush(buffer)
+                    buffer = []
+            if buffer and not self._error:
+                self._flush(buffer)
+        except Exception as e:
+            self._fail("insert", e)
+            while not done:
+                done = self._batches.get() is _DONE
+
+    def _flush(self, items):
+        start = time.perf_counter()
+        self.stats["inserted"] += insert_chunks_bulk(self.table, items)
+        self.stats["insert_seconds"] += time.perf_counter() - start
+        if self.stats["first_insert_after_seconds"] is None:
+            self.stats["first_insert_after_seconds"] = round(time.perf_counter() - self._start, 3)
@@ -7,16 +7,20 @@ def clean_redundant_text(text: str) -> str:
     text = re.sub(r"( \b\w+\b)( \1)+", r"\1", text)
     return text.strip()
 
+def chunk_page_text(text: str, page: int, chunk_size=500, overlap=50):
+    """Yields {"text", "page"} windows of chunk_size characters overlapping by `overlap`."""
+    text = text.replace("\n", " ").strip()
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        chunk_text = clean_redundant_text(text[start:end])
+        if chunk_text.strip():
+            yield {"text": chunk_text, "page": page}
+        start += chunk_size - overlap
+
 def extract_text_chunks(pdf_path: str, chunk_size=500, overlap=50):
     doc = fitz.open(pdf_path)
     chunks = []
     for page_num, page in enumerate(doc):
-        text = page.get_text().replace("\n", " ").strip()
-        start = 0
-        while start < len(text):
-            end = min(start + chunk_size, len(text))
-            chunk_text = clean_redundant_text(text[start:end])
-            if chunk_text.strip():
-                chunks.append({"text": chunk_text, "page": page_num + 1})
-            start += chunk_size - overlap
+        chunks.extend(chunk_page_text(page.get_text(), page_num + 1, chunk_size, overlap))
     return chunks
@@ -0,0 +1,141 @@
+# engines.py
+import os
+import gc
+import time
+import logging
+import threading
+
+# -------------------------------
+# Lazy OCR engine registry
+# -------------------------------
+# Engines (PaddleOCR, TrOCR, IndicOCR) are built on first use instead of at
+# import, so importing the OCR modules is cheap and the API starts without the
+# OCR stack. Engines unused for OCR_ENGINE_IDLE_SECONDS are dropped (0 = keep).
+# A failed load is remembered and retried only after the idle timeout.
+OCR_ENGINE_IDLE_SECONDS = int(os.getenv("OCR_ENGINE_IDLE_SECONDS", 900))
+
+def _rss_mb():
+    """Resident set size of this process in MB (Linux /proc), or None."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return None
+
+def _param_mb(engine):
+    """Parameter memory of torch models inside an engine, in MB."""
+    parts = engine if isinstance(engine, tuple) else (engine,)
+    total = 0
+    for part in parts:
+        if hasattr(part, "parameters"):
+            total += sum(p.numel() * p.element_size() for p in part.parameters())
+    return total / (1024 * 1024) if total else None
+
+class EngineRegistry:
+    def __init__(self, idle_seconds=900):
+        self.idle_seconds = idle_seconds
+        self._loaders = {}
+        self._engines = {}
+        self._stats = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+
+    def register(self, name, loader):
+        self._loaders[name] = loader
+        self._locks[name] = threading.Lock()
+        self._stats[name] = {
+            "loaded": False, "loads": 0, "uses": 0, "load_seconds": None,
+            "rss_delta_mb": None, "param_mb": None, "last_used": None, "error": None, "failed_at": None
+        }
+
+    def get(self, name):
+        """Returns the engine, loading it on first use; None if it cannot be loaded."""
+        stats = self._stats[name]
+        with self._locks[name]:
+            if name not in self._engines:
+                if stats["failed_at"] and time.time() - stats["failed_at"] < (self.idle_seconds or float("inf")):
+                    return None
+                self._load(name)
+            stats["uses"] += 1
+            stats["last_used"] = time.time()
+            return self._engines.get(name)
+
+    def _load(self, name):
+        stats = self._stats[name]
+        rss_before = _rss_mb()
+        start = time.perf_counter()
+        try:
+            engine = self._loaders[name]()
+        except Exception as e:
+            logging.warning(f"OCR engine '{name}' not available: {e}")
+            stats.update({"error": str(e), "failed_at": time.time()})
+            return
+        rss_after = _rss_mb()
+        self._engines[name] = engine
+        stats.update({
+            "loaded": True,
+            "loads": stats["loads"] + 1,
+            "load_seconds": round(time.perf_counter() - start, 3),
+            "rss_delta_mb": round(rss_after - rss_before, 1) if rss_before is not None and rss_after is not None else None,
+            "param_mb": _param_mb(engine),
+            "error": None,
+            "failed_at": None
+        })
+        logging.info(f"✅ OCR engine '{name}' loaded in {stats['load_seconds']}s")
+        self._start_reaper()
+
+    def unload(self, name):
+        with self._locks[name]:
+            if self._engines.pop(name, None) is not None:
+                self._stats[name]["loaded"] = False
+                gc.collect()
+                logging.info(f"OCR engine '{name}' unloaded")
+
+    def unload_idle(self):
+        if not self.idle_seconds:
+            return
+        now = time.time()
+        for name, stats in self._stats.items():
+            if stats["loaded"] and now - (stats["last_used"] or now) > self.idle_seconds:
+                self.unload(name)
+
+    def _start_reaper(self):
+        with self._lock:
+            if self._reaper is not None or not self.idle_seconds:
+                return
+            def reap():
+                while True:
+                    time.sleep(min(60, self.idle_seconds))
+                    self.unload_idle()
+            self._reaper = threading.Thread(target=reap, name="ocr-engine-reaper", daemon=True)
+            self._reaper.start()
+
+    def stats(self):
+        return {
+            "pid": os.getpid(),
+            "idle_seconds": self.idle_seconds,
+            "rss_mb": _rss_mb(),
+            "engines": {name: dict(s) for name, s in self._stats.items()}
+        }
+
+# -------------------------------
+# Engine loaders (heavy imports happen here, not at module import)
+# -------------------------------
+def _load_paddle_en():
+    from paddleocr import PaddleOCR
+    return PaddleOCR(lang="en", det=True, rec=True, cls=True)
+
+def _load_vision_encoder_decoder(model_name):
+    from transformers import TrOCRProcessor, VisionEncoderDecoderModel
+    processor = TrOCRProcessor.from_pretrained(model_name)
+    model = VisionEncoderDecoderModel.from_pretrained(model_name)
+    model.eval()
+    return processor, model
+
+registry = EngineRegistry(idle_seconds=OCR_ENGINE_IDLE_SECONDS)
+registry.register("paddle_en", _load_paddle_en)
+# TrOCR (Hugging Face, English fallback)
+registry.register("trocr", lambda: _load_vision_encoder_decoder("microsoft/trocr-base-printed"))
+# IndicOCR (AI4Bharat, Malayalam primary)
+registry.register("indicocr", lambda: _load_vision_encoder_decoder("AI4Bharat/IndicOCR"))
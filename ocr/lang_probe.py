@@ -0,0 +1,158 @@
+# lang_probe.py
+import os
+import csv
+import time
+import argparse
+import logging
+import statistics
+import cv2
+import numpy as np
+import pytesseract
+
+# -------------------------------
+# Language Heuristic
+# -------------------------------
+def detect_language_heuristic(text: str) -> str:
+    """Heuristic: detect Malayalam presence via Unicode range."""
+    if not text.strip():
+        return "unknown"
+    mal_count = sum([0x0D00 <= ord(c) <= 0x0D7F for c in text])
+    ratio = mal_count / len(text)
+    if ratio > 0.4:
+        return "ml"
+    elif ratio > 0.1:
+        return "hybrid"
+    else:
+        return "en"
+
+# -------------------------------
+# Cheap language probe
+# -------------------------------
+# The engine choice only needs the en / ml / hybrid decision, not a transcript.
+# Instead of an eng+mal Tesseract pass over the whole 300-DPI page, the probe:
+#   1. uses the page's own text layer when it has enough clean text, else
+#   2. finds text lines on a small copy of the page (row ink profile), takes a
+#      few evenly spaced lines at full resolution and OCRs them as one strip, else
+#   3. OCRs a downsampled page.
+# The same heuristic runs on whatever text comes back.
+OCR_LANG_PROBE = os.getenv("OCR_LANG_PROBE", "lines")   # "lines" | "full" (legacy full-page pass)
+PROBE_LINES = int(os.getenv("OCR_PROBE_LINES", 8))
+PROBE_MIN_NATIVE_CHARS = 20
+PROBE_DETECT_WIDTH = 600        # px width used for line finding
+PROBE_DOWNSAMPLE = 0.5          # page scale for the fallback pass
+PROBE_CONFIG = "--psm 6"
+
+def _gray(image):
+    if image.ndim == 2:
+        return image
+    return cv2.cvtColor(image, cv2.COLOR_RGBA2GRAY if image.shape[2] == 4 else cv2.COLOR_RGB2GRAY)
+
+def find_text_bands(gray):
+    """Returns (top, bottom) pixel rows of text lines, via the ink profile of a small copy."""
+    h, w = gray.shape
+    scale = min(1.0, PROBE_DETECT_WIDTH / w)
+    small = cv2.resize(gray, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+    _, ink = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    rows = (ink > 0).mean(axis=1) > 0.01
+
+    bands, start = [], None
+    for y, has_ink in enumerate(np.append(rows, False)):
+        if has_ink and start is None:
+            start = y
+        elif not has_ink and start is not None:
+            if y - start >= 2:
+                pad = 2
+                bands.append((max(0, int((start - pad) / scale)), min(h, int((y + pad) / scale))))
+            start = None
+    return bands
+
+def sample_bands(bands, n):
+    if len(bands) <= n:
+        return bands
+    # Spread over the page so mixed-script regions are represented
+    heights = sorted(b - t for t, b in bands)
+    limit = 3 * heights[len(heights) // 2]   # skip figures / merged blocks
+    lines = [(t, b) for t, b in bands if b - t <= limit] or bands
+    step = (len(lines) - 1) / max(1, n - 1)
+    return [lines[round(i * step)] for i in range(min(n, len(lines)))]
+
+def probe_language(image, native_text="", lines=None, method=None):
+    """
+    Returns (lang, info). `image` is the page raster (array); `native_text` is
+    the page's text layer, used when it has enough clean characters. `method`
+    ("lines" | "full") overrides OCR_LANG_PROBE for this call.
+    """
+    start = time.perf_counter()
+    if native_text and len(native_text.strip()) >= PROBE_MIN_NATIVE_CHARS:
+        lang = detect_language_heuristic(native_text)
+        return lang, {"method": "native", "ms": (time.perf_counter() - start) * 1000}
+
+    gray = _gray(image)
+    if (method or OCR_LANG_PROBE) == "full":
+        text = pytesseract.image_to_string(gray, config=PROBE_CONFIG, lang="eng+mal")
+        method = "full"
+    else:
+        bands = sample_bands(find_text_bands(gray), lines or PROBE_LINES)
+        if bands:
+            gap = np.full((12, gray.shape[1]), 255, dtype=np.uint8)
+            strip = np.vstack([part for t, b in bands for part in (gray[t:b], gap)])
+            text = pytesseract.image_to_string(strip, config=PROBE_CONFIG, lang="eng+mal")
+            method = "lines"
+        else:
+            text = ""
+        if not text.strip():
+            small = cv2.resize(gray, None, fx=PROBE_DOWNSAMPLE, fy=PROBE_DOWNSAMPLE, interpolation=cv2.INTER_AREA)
+            text = pytesseract.image_to_string(small, config=PROBE_CONFIG, lang="eng+mal")
+            method = "downsampled"
+
+    return detect_language_heuristic(text), {"method": method, "ms": (time.perf_counter() - start) * 1000}
+
+# -------------------------------
+# Evaluation against the legacy full-page pass
+# -------------------------------
+def evaluate(labels_csv, dpi=300):
+    """
+    labels_csv rows: pdf,page,lang (page is 1-based, lang in en/ml/hybrid).
+    Compares the legacy full-page probe with the line probe on accuracy,
+    agreement and per-page time. Text layers are ignored so both see pixels only.
+    """
+    import fitz  # PyMuPDF
+
+    with open(labels_csv, encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    results = []
+    for row in rows:
+        with fitz.open(row["pdf"]) as doc:
+            pix = doc[int(row["page"]) - 1].get_pixmap(dpi=dpi, colorspace=fitz.csRGB, alpha=False)
+            image = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+        legacy, legacy_info = probe_language(image, method="full")
+        probe, probe_info = probe_language(image, method="lines")
+        results.append({
+            "label": row["lang"].strip(), "legacy": legacy, "probe": probe,
+            "legacy_ms": legacy_info["ms"], "probe_ms": probe_info["ms"], "method": probe_info["method"]
+        })
+        logging.info(f"{row['pdf']} p{row['page']}: label={row['lang']} legacy={legacy} probe={probe} "
+                     f"({legacy_info['ms']:.0f} ms vs {probe_info['ms']:.0f} ms, {probe_info['method']})")
+
+    n = len(results)
+    if not n:
+        return {}
+    summary = {
+        "pages": n,
+        "legacy_accuracy": sum(r["legacy"] == r["label"] for r in results) / n,
+        "probe_accuracy": sum(r["probe"] == r["label"] for r in results) / n,
+        "agreement": sum(r["legacy"] == r["probe"] for r in results) / n,
+        "legacy_median_ms": statistics.median(r["legacy_ms"] for r in results),
+        "probe_median_ms": statistics.median(r["probe_ms"] for r in results),
+    }
+    summary["speedup"] = summary["legacy_median_ms"] / max(summary["probe_median_ms"], 1e-6)
+    return summary
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Compare the line probe with the full-page language pass")
+    parser.add_argument("--labels", required=True, help="CSV with columns pdf,page,lang")
+    parser.add_argument("--dpi", type=int, default=300)
+    args = parser.parse_args()
+    for k, v in evaluate(args.labels, dpi=args.dpi).items():
+        print(f"{k:>18}: {v:.3f}" if isinstance(v, float) else f"{k:>18}: {v}")
@@ -0,0 +1,180 @@
+# page_store.py
+import os
+import json
+import mmap
+import zlib
+import struct
+import argparse
+
+# -------------------------------
+# Page-indexed OCR output (.ocrp)
+# -------------------------------
+# Layout:
+#   header   b"OCRP" + u16 format version
+#   records  u32 length + zlib(JSON), one per page, then one for the tables
+#   index    u32 length + zlib(JSON) {"metadata", "pages": [[page_number, offset, length]], "tables": [offset, length]}
+#   footer   u64 index offset + b"OCRI"
+# Pages are written as they finish, so the writer never holds the document.
+# Readers mmap the file, read only the footer and index up front, and decode a
+# page only when it is asked for.
+MAGIC = b"OCRP"
+FOOTER_MAGIC = b"OCRI"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<4sH")
+_LEN = struct.Struct("<I")
+_FOOTER = struct.Struct("<Q4s")
+
+def _encode(obj):
+    return zlib.compress(json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 6)
+
+class PageStoreWriter:
+    """Appends page records; the file appears at `path` only once close() succeeds."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._tmp_path = self.path + ".tmp"
+        self._f = open(self._tmp_path, "wb")
+        self._f.write(_HEADER.pack(MAGIC, FORMAT_VERSION))
+        self._pages = []
+        self._tables = None
+
+    def _write_record(self, obj):
+        data = _encode(obj)
+        offset = self._f.tell()
+        self._f.write(_LEN.pack(len(data)))
+        self._f.write(data)
+        return offset, len(data)
+
+    def write_page(self, page):
+        offset, length = self._write_record(page)
+        self._pages.append([page.get("page_number"), offset, length])
+
+    def write_tables(self, tables):
+        self._tables = list(self._write_record(tables))
+
+    def close(self, metadata=None):
+        index_offset, _ = self._write_record({
+            "metadata": metadata or {},
+            "pages": self._pages,
+            "tables": self._tables
+        })
+        self._f.write(_FOOTER.pack(index_offset, FOOTER_MAGIC))
+        self._f.close()
+        os.replace(self._tmp_path, self.path)
+        return self.path
+
+    def abort(self):
+        self._f.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        elif not self._f.closed:
+            self.close()
+
+class PageStore:
+    """Lazy, memory-mapped reader for .ocrp files."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._f = open(self.path, "rb")
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = _HEADER.unpack_from(self._mm, 0)
+        index_offset, footer_magic = _FOOTER.unpack_from(self._mm, len(self._mm) - _FOOTER.size)
+        if magic != MAGIC or footer_magic != FOOTER_MAGIC:
+            raise ValueError(f"{self.path} is not a complete OCR page store")
+        if version > FORMAT_VERSION:
+            raise ValueError(f"{self.path}: unsupported page store version {version}")
+        index = self._read_record(index_offset)
+        self.metadata = index["metadata"]
+        self._pages = index["pages"]
+        self._by_number = {number: i for i, (number, _, _) in enumerate(self._pages)}
+        self._tables = index["tables"]
+
+    def _read_record(self, offset):
+        (length,) = _LEN.unpack_from(self._mm, offset)
+        start = offset + _LEN.size
+        return json.loads(zlib.decompress(self._mm[start:start + length]))
+
+    def __len__(self):
+        return len(self._pages)
+
+    def page_numbers(self):
+        return [number for number, _, _ in self._pages]
+
+    def page(self, page_number):
+        """Decodes one page by its 1-based page number."""
+        i = self._by_number.get(page_number)
+        if i is None:
+            raise KeyError(page_number)
+        return self._read_record(self._pages[i][1])
+
+    def __iter__(self):
+        for _, offset, _ in self._pages:
+            yield self._read_record(offset)
+
+    def tables(self):
+        return self._read_record(self._tables[0]) if self._tables else []
+
+    def to_dict(self):
+        """The legacy process_pdf JSON shape (loads every page)."""
+        return {
+            "file": self.metadata.get("file"),
+            "metadata": {k: v for k, v in self.metadata.items() if k != "file"},
+            "pages": list(self),
+            "tables": self.tables()
+        }
+
+    def export_json(self, json_path):
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        return json_path
+
+    def close(self):
+        self._mm.close()
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def iter_ocr_pages(path):
+    """Pages from either a .ocrp store (lazily) or a legacy OCR JSON file."""
+    if str(path).endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            yield from json.load(f).get("pages", [])
+        return
+    with PageStore(path) as store:
+        yield from store
+
+def read_ocr_metadata(path):
+    if str(path).endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("metadata", {})
+    with PageStore(path) as store:
+        return store.metadata
+
+# -------------------------------
+# CLI: inspect / export
+# -------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or export an .ocrp page store")
+    parser.add_argument("store", help="path to .ocrp file")
+    parser.add_argument("--page", type=int, default=None, help="print one page (1-based)")
+    parser.add_argument("--export-json", default=None, help="write the legacy JSON format here")
+    args = parser.parse_args()
+
+    with PageStore(args.store) as store:
+        if args.export_json:
+            print(store.export_json(args.export_json))
+        elif args.page is not None:
+            print(json.dumps(store.page(args.page), ensure_ascii=False, indent=2))
+        else:
+            print(json.dumps({"metadata": store.metadata, "pages": store.page_numbers()}, ensure_ascii=False, indent=2))
@@ -4,69 +4,84 @@ import argparse
 import logging
 import fitz  # PyMuPDF
 from pathlib import Path
-from paddleocr import PaddleOCR
 import pytesseract
-from transformers import TrOCRProcessor, VisionEncoderDecoderModel
 from PIL import Image
-import camelot
 import json
 import cv2
 import numpy as np
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    from ocr import lang_probe
+    from ocr.lang_probe import detect_language_heuristic, probe_language
+    from ocr.engines import registry as engines
+    from ocr.result_cache import result_cache, make_key, sha256_file, package_version
+    from ocr.page_store import PageStoreWriter, PageStore
+except ImportError:  # run as a script from inside ocr/
+    import lang_probe
+    from lang_probe import detect_language_heuristic, probe_language
+    from engines import registry as engines
+    from result_cache import result_cache, make_key, sha256_file, package_version
+    from page_store import PageStoreWriter, PageStore
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 # -------------------------------
 # OCR Engines
 # -------------------------------
-paddle_en = None
-try:
-    paddle_en = PaddleOCR(lang="en", det=True, rec=True, cls=True)
-except Exception as e:
-    logging.warning(f"PaddleOCR not fully available: {e}")
+# PaddleOCR / TrOCR / IndicOCR are built on first use by the registry in
+# ocr/engines.py ("paddle_en", "trocr", "indicocr").
 
 # Tesseract configs
 tess_config = "--psm 6"
 
-# TrOCR (Hugging Face, English fallback)
-processor = TrOCRProcessor.from_pretrained("microsoft/trocr-base-printed")
-trocr_model = VisionEncoderDecoderModel.from_pretrained("microsoft/trocr-base-printed")
+# -------------------------------
+# Page rasters (in memory)
+# -------------------------------
+# Pages travel between stages as one HxWxC uint8 array (RGB, or 2-D grayscale
+# after preprocessing). PNGs are only written when OCR_DEBUG_IMAGES is set.
+OCR_DEBUG_IMAGES = os.getenv("OCR_DEBUG_IMAGES", "false").lower() == "true"
 
-# IndicOCR (AI4Bharat, Malayalam primary)
-indic_processor, indic_model = None, None
-try:
-    indic_processor = TrOCRProcessor.from_pretrained("AI4Bharat/IndicOCR")
-    indic_model = VisionEncoderDecoderModel.from_pretrained("AI4Bharat/IndicOCR")
-    logging.info("✅ IndicOCR (multi-script) loaded successfully")
-except Exception as e:
-    logging.warning(f"IndicOCR not available: {e}")
-
-# -------------------------------
-# Language Heuristic
-# -------------------------------
-def detect_language_heuristic(text: str) -> str:
-    """Heuristic: detect Malayalam presence via Unicode range."""
-    if not text.strip():
-        return "unknown"
-    mal_count = sum([0x0D00 <= ord(c) <= 0x0D7F for c in text])
-    ratio = mal_count / len(text)
-    if ratio > 0.4:
-        return "ml"
-    elif ratio > 0.1:
-        return "hybrid"
-    else:
-        return "en"
+def pixmap_to_array(pix):
+    """Wraps the pixmap's sample buffer without copying; keep `pix` alive while the array is used."""
+    samples = pix.samples_mv if hasattr(pix, "samples_mv") else pix.samples
+    return np.frombuffer(samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+
+def load_image(image):
+    """Accepts an array or an image path (kept for callers that still pass files)."""
+    if isinstance(image, np.ndarray):
+        return image
+    return np.asarray(Image.open(image).convert("RGB"))
+
+def to_rgb(image):
+    image = load_image(image)
+    if image.ndim == 2:
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+    if image.shape[2] == 4:
+        return cv2.cvtColor(image, cv2.COLOR_RGBA2RGB)
+    return image
+
+def save_debug_image(image, path):
+    if OCR_DEBUG_IMAGES:
+        out = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+        cv2.imwrite(str(path), out)
 
 # -------------------------------
 # Preprocessing for Malayalam
 # -------------------------------
-def preprocess_for_malayalam(image_path):
-    img = cv2.imread(str(image_path), cv2.IMREAD_GRAYSCALE)
-    if img is None:
-        return str(image_path)  # fallback
+def preprocess_for_malayalam(image, debug_path=None):
+    img = load_image(image)
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
     # Binarization
     _, thresh = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
     # Deskew
     coords = np.column_stack(np.where(thresh > 0))
+    if len(coords) == 0:
+        return img  # blank page
     angle = cv2.minAreaRect(coords)[-1]
     if angle < -45:
         angle = -(90 + angle)
@@ -77,19 +92,20 @@ def preprocess_for_malayalam(image_path):
     deskewed = cv2.warpAffine(thresh, M, (w, h),
                               flags=cv2.INTER_CUBIC,
                               borderMode=cv2.BORDER_REPLICATE)
-    # Save temp preprocessed
-    out_path = str(image_path).replace(".png", "_mlproc.png")
-    cv2.imwrite(out_path, deskewed)
-    return out_path
+    if debug_path:
+        save_debug_image(deskewed, debug_path)
+    return deskewed
 
 # -------------------------------
-# OCR Runners
+# OCR Runners (arrays in, lines out)
 # -------------------------------
-def run_paddle(image_path):
+def run_paddle(image):
+    paddle_en = engines.get("paddle_en")
     if not paddle_en:
         return None
     try:
-        result = paddle_en.ocr(image_path, cls=True)
+        # PaddleOCR takes ndarrays in OpenCV (BGR) channel order
+        result = paddle_en.ocr(cv2.cvtColor(to_rgb(image), cv2.COLOR_RGB2BGR), cls=True)
         lines = []
         for block in result[0]:
             if len(block) >= 2:
@@ -101,10 +117,10 @@ def run_paddle(image_path):
         logging.warning(f"Paddle failed: {e}")
         return None
 
-def run_tesseract(image_path, lang="eng"):
+def run_tesseract(image, lang="eng"):
     try:
         data = pytesseract.image_to_data(
-            Image.open(image_path),
+            load_image(image),
             config=tess_config,
             lang=lang,
             output_type=pytesseract.Output.DICT
@@ -115,8 +131,10 @@ def run_tesseract(image_path, lang="eng"):
                 bbox = [data["left"][i], data["top"][i], data["width"][i], data["height"][i]]
                 conf = None
                 try:
-                    conf = float(data["conf"][i]) if str(data["conf"][i]).isdigit() else None
-                except Exception:
+                    # Newer Tesseract reports float strings ("96.33"); -1 means no confidence
+                    conf = float(data["conf"][i])
+                    conf = conf if conf >= 0 else None
+                except (TypeError, ValueError):
                     pass
                 lines.append({
                     "text": data["text"][i],
@@ -129,32 +147,130 @@ def run_tesseract(image_path, lang="eng"):
         logging.warning(f"Tesseract with data failed: {e}")
         return None
 
-def run_trocr(image_path):
+# -------------------------------
+# Line-level recognition (TrOCR / IndicOCR)
+# -------------------------------
+# TrOCR-style models are trained on single text lines. Lines are located with
+# Paddle's detector (det only) or Tesseract's line grouping, cropped, and
+# decoded in batches; each output keeps the bbox of its crop.
+# OCR_LINE_RECOGNITION=page restores the old whole-page single generate call.
+OCR_LINE_RECOGNITION = os.getenv("OCR_LINE_RECOGNITION", "lines")
+TROCR_BATCH_SIZE = int(os.getenv("TROCR_BATCH_SIZE", 16))
+TROCR_NUM_BEAMS = int(os.getenv("TROCR_NUM_BEAMS", 1))
+TROCR_MAX_NEW_TOKENS = int(os.getenv("TROCR_MAX_NEW_TOKENS", 64))
+LINE_PAD = 4  # px around each crop
+
+def tesseract_line_boxes(image, lang="eng"):
+    """Groups Tesseract words by (block, paragraph, line) into [left, top, width, height] boxes."""
+    data = pytesseract.image_to_data(load_image(image), config=tess_config, lang=lang,
+                                     output_type=pytesseract.Output.DICT)
+    lines = {}
+    for i, word in enumerate(data["text"]):
+        if not word.strip():
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        l, t = data["left"][i], data["top"][i]
+        r, b = l + data["width"][i], t + data["height"][i]
+        if key in lines:
+            pl, pt, pr, pb = lines[key]
+            lines[key] = (min(pl, l), min(pt, t), max(pr, r), max(pb, b))
+        else:
+            lines[key] = (l, t, r, b)
+    return [[l, t, r - l, b - t] for l, t, r, b in lines.values()]
+
+def detect_line_boxes(image, lang="eng"):
+    """Line boxes as [left, top, width, height], in reading order."""
+    boxes = []
+    paddle_en = engines.get("paddle_en")
+    if paddle_en:
+        try:
+            result = paddle_en.ocr(cv2.cvtColor(to_rgb(image), cv2.COLOR_RGB2BGR), det=True, rec=False, cls=False)
+            for quad in result[0] or []:
+                xs, ys = [p[0] for p in quad], [p[1] for p in quad]
+                boxes.append([int(min(xs)), int(min(ys)), int(max(xs) - min(xs)), int(max(ys) - min(ys))])
+        except Exception as e:
+            logging.warning(f"Paddle line detection failed: {e}")
+    if not boxes:
+        try:
+            boxes = tesseract_line_boxes(image, lang=lang)
+        except Exception as e:
+            logging.warning(f"Tesseract line detection failed: {e}")
+    return sorted((b for b in boxes if b[2] > 2 and b[3] > 2), key=lambda b: (b[1], b[0]))
+
+def _sequence_confidences(model, output, num_beams):
+    """Mean per-token probability of each generated sequence, or None per line if unavailable."""
     try:
-        image = Image.open(image_path).convert("RGB")
-        pixel_values = processor(images=image, return_tensors="pt").pixel_values
-        generated_ids = trocr_model.generate(pixel_values)
-        text = processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
-        return [{"text": text, "conf": None, "bbox": None, "source": "trocr"}]
-    except Exception as e:
-        logging.warning(f"TrOCR failed: {e}")
+        # Beam search scores are already log-softmaxed; greedy ones are raw logits
+        scores = model.compute_transition_scores(
+            output.sequences, output.scores, getattr(output, "beam_indices", None), normalize_logits=num_beams == 1
+        )
+        pad_id = model.generation_config.pad_token_id
+        mask = output.sequences[:, -scores.shape[1]:] != pad_id
+        mean = (scores * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+        return [round(float(c), 4) for c in mean.exp()]
+    except Exception:
+        return [None] * output.sequences.shape[0]
+
+def recognize_lines(engine_name, image, boxes=None, lang="eng", source=None,
+                    batch_size=None, num_beams=None):
+    """
+    Crops every detected line and decodes the crops in batches with a
+    VisionEncoderDecoder engine ("trocr" / "indicocr"). Returns OCR lines
+    with bboxes, or None when the engine or line boxes are unavailable.
+    """
+    engine = engines.get(engine_name)
+    if not engine:
         return None
+    proc, model = engine
+    source = source or engine_name
+    batch_size = batch_size or TROCR_BATCH_SIZE
+    num_beams = num_beams or TROCR_NUM_BEAMS
 
-def run_indicocr(image_path):
-    if not indic_processor or not indic_model:
+    rgb = to_rgb(image)
+    if OCR_LINE_RECOGNITION == "page":
+        boxes = [[0, 0, rgb.shape[1], rgb.shape[0]]]
+    elif boxes is None:
+        boxes = detect_line_boxes(image, lang=lang)
+    if not boxes:
         return None
+
+    import torch
+    h, w = rgb.shape[:2]
+    lines = []
     try:
-        image = Image.open(image_path).convert("RGB")
-        pixel_values = indic_processor(images=image, return_tensors="pt").pixel_values
-        generated_ids = indic_model.generate(pixel_values)
-        text = indic_processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
-        return [{"text": text, "conf": None, "bbox": None, "source": "indicocr"}]
+        with torch.inference_mode():
+            for i in range(0, len(boxes), batch_size):
+                batch_boxes = boxes[i:i + batch_size]
+                crops = [
+                    rgb[max(0, t - LINE_PAD):min(h, t + bh + LINE_PAD), max(0, l - LINE_PAD):min(w, l + bw + LINE_PAD)]
+                    for l, t, bw, bh in batch_boxes
+                ]
+                pixel_values = proc(images=crops, return_tensors="pt").pixel_values
+                output = model.generate(
+                    pixel_values,
+                    num_beams=num_beams,
+                    max_new_tokens=TROCR_MAX_NEW_TOKENS,
+                    return_dict_in_generate=True,
+                    output_scores=True
+                )
+                texts = proc.batch_decode(output.sequences, skip_special_tokens=True)
+                for box, text, conf in zip(batch_boxes, texts, _sequence_confidences(model, output, num_beams)):
+                    if text.strip():
+                        lines.append({"text": text.strip(), "conf": conf, "bbox": list(box), "source": source})
     except Exception as e:
-        logging.warning(f"IndicOCR failed: {e}")
+        logging.warning(f"{source} line recognition failed: {e}")
         return None
+    return lines
+
+def run_trocr(image, boxes=None):
+    return recognize_lines("trocr", image, boxes=boxes, lang="eng", source="trocr")
+
+def run_indicocr(image, boxes=None):
+    return recognize_lines("indicocr", image, boxes=boxes, lang="mal", source="indicocr")
 
 def extract_tables(pdf_path, max_pages=3):
     try:
+        import camelot  # heavy (ghostscript / opencv); only needed when tables are extracted
         tables = camelot.read_pdf(pdf_path, pages=f"1-{max_pages}", flavor="lattice")
         extracted = []
         for i, table in enumerate(tables):
@@ -168,72 +284,532 @@ def extract_tables(pdf_path, max_pages=3):
         logging.warning(f"Camelot table extraction failed: {e}")
         return []
 
+# -------------------------------
+# Native text layer (born-digital pages)
+# -------------------------------
+# "auto": use the PDF text layer when it looks trustworthy, OCR otherwise; "off": always OCR
+OCR_TEXT_LAYER = os.getenv("OCR_TEXT_LAYER", "auto")
+TEXT_LAYER_MIN_CHARS = int(os.getenv("TEXT_LAYER_MIN_CHARS", 100))
+TEXT_LAYER_MIN_GLYPH_RATIO = 0.95   # share of chars with a real Unicode mapping
+TEXT_LAYER_MIN_SANE_RATIO = 0.90    # share of letters/digits/punctuation/spaces
+
+def _is_sane_char(c):
+    return c.isalnum() or c.isspace() or c in ".,;:!?()[]{}'\"-–—/%$€£&@#*+=<>§°" or 0x0D00 <= ord(c) <= 0x0D7F
+
+def native_text_lines(page, dpi=300, min_chars=None):
+    """
+    Reads the page's text layer with get_text("dict").
+    Returns lines in the OCR output shape (bbox = [left, top, width, height] in
+    pixels at `dpi`, like Tesseract), or None when the layer is missing,
+    too sparse, or made of unmapped glyphs / garbage.
+    """
+    min_chars = TEXT_LAYER_MIN_CHARS if min_chars is None else min_chars
+    scale = dpi / 72.0
+    lines = []
+    for block in page.get_text("dict").get("blocks", []):
+        if block.get("type") != 0:  # image block
+            continue
+        for line in block.get("lines", []):
+            text = "".join(span.get("text", "") for span in line.get("spans", [])).strip()
+            if not text:
+                continue
+            x0, y0, x1, y1 = line["bbox"]
+            lines.append({
+                "text": text,
+                "conf": None,
+                "bbox": [int(x0 * scale), int(y0 * scale), int((x1 - x0) * scale), int((y1 - y0) * scale)],
+                "source": "native"
+            })
+
+    chars = "".join(l["text"] for l in lines)
+    if len(chars) < min_chars or not text_layer_is_clean(chars):
+        return None
+    return lines
+
+def text_layer_is_clean(chars):
+    """Glyph coverage and Unicode sanity checks on extracted text."""
+    chars = "".join(chars.split())
+    if not chars:
+        return False
+    # Fonts without a ToUnicode map extract as U+FFFD or private-use code points
+    unmapped = sum(c == "\ufffd" or 0xE000 <= ord(c) <= 0xF8FF for c in chars)
+    if 1 - unmapped / len(chars) < TEXT_LAYER_MIN_GLYPH_RATIO:
+        return False
+    return sum(_is_sane_char(c) for c in chars) / len(chars) >= TEXT_LAYER_MIN_SANE_RATIO
+
+# -------------------------------
+# Adaptive DPI
+# -------------------------------
+# Pages are rendered at OCR_LOW_DPI first. Lines whose confidence (normalized
+# to 0-1) falls below OCR_CONF_THRESHOLD are re-rendered at the requested DPI:
+# only their regions (clipped pixmaps), or the whole page when more than
+# OCR_ESCALATE_PAGE_FRACTION of the lines are weak.
+OCR_ADAPTIVE_DPI = os.getenv("OCR_ADAPTIVE_DPI", "false").lower() == "true"
+OCR_LOW_DPI = int(os.getenv("OCR_LOW_DPI", 200))
+OCR_CONF_THRESHOLD = float(os.getenv("OCR_CONF_THRESHOLD", 0.6))
+OCR_ESCALATE_PAGE_FRACTION = float(os.getenv("OCR_ESCALATE_PAGE_FRACTION", 0.3))
+REGION_PAD = 8  # px at the low DPI
+
+def line_confidence(line):
+    """Line confidence on a 0-1 scale (Tesseract reports 0-100); None if unknown."""
+    conf = line.get("conf")
+    if conf is None:
+        return None
+    return conf / 100.0 if str(line.get("source", "")).startswith("tesseract") else float(conf)
+
+def is_weak(line):
+    conf = line_confidence(line)
+    return conf is not None and conf < OCR_CONF_THRESHOLD
+
+def bbox_rect(bbox):
+    """(x0, y0, x1, y1) from a [left, top, width, height] or flattened-quad (Paddle) bbox."""
+    if len(bbox) == 4:
+        l, t, w, h = bbox
+        return l, t, l + w, t + h
+    xs, ys = bbox[0::2], bbox[1::2]
+    return min(xs), min(ys), max(xs), max(ys)
+
+def transform_bbox(bbox, scale, dx=0, dy=0):
+    if not bbox:
+        return bbox
+    if len(bbox) == 4:
+        l, t, w, h = bbox
+        return [int(l * scale + dx), int(t * scale + dy), int(w * scale), int(h * scale)]
+    return [int(v * scale + (dx if i % 2 == 0 else dy)) for i, v in enumerate(bbox)]
+
+def merge_rects(rects, pad=REGION_PAD):
+    """Pads rects and merges overlapping ones (words of one weak line become one region)."""
+    merged = []
+    for x0, y0, x1, y1 in sorted(rects, key=lambda r: (r[1], r[0])):
+        x0, y0, x1, y1 = x0 - pad, y0 - pad, x1 + pad, y1 + pad
+        for i, (a0, b0, a1, b1) in enumerate(merged):
+            if x0 <= a1 and a0 <= x1 and y0 <= b1 and b0 <= y1:
+                merged[i] = (min(a0, x0), min(b0, y0), max(a1, x1), max(b1, y1))
+                break
+        else:
+            merged.append((x0, y0, x1, y1))
+    return merged
+
+def render(page, dpi, clip=None):
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csRGB, alpha=False, clip=clip)
+    return pix, pixmap_to_array(pix)
+
+# -------------------------------
+# Page OCR
+# -------------------------------
+def recognize(image, lang, debug_path=None):
+    """Runs the engine chain chosen for `lang` on one raster."""
+    lines = None
+    if lang == "ml":
+        preproc_img = preprocess_for_malayalam(image, debug_path=debug_path)
+        lines = run_indicocr(preproc_img) or run_tesseract(preproc_img, lang="mal")
+    elif lang == "hybrid":
+        lines = run_paddle(image) or run_tesseract(image, lang="eng")
+    else:  # English
+        lines = run_paddle(image) or run_tesseract(image, lang="eng")
+
+    if not lines:
+        lines = run_trocr(image)
+    return lines or []
+
+def escalate_regions(page, lines, lang, low_dpi, high_dpi):
+    """
+    Re-OCRs the regions of weak lines at high_dpi and swaps them in.
+    All bboxes stay in low_dpi pixel coordinates. Returns (lines, regions escalated).
+    """
+    weak = [l for l in lines if l.get("bbox") and is_weak(l)]
+    regions = merge_rects([bbox_rect(l["bbox"]) for l in weak])
+    to_points = 72.0 / low_dpi
+    back = low_dpi / high_dpi
+    escalated = 0
+
+    for x0, y0, x1, y1 in regions:
+        clip = fitz.Rect(x0 * to_points, y0 * to_points, x1 * to_points, y1 * to_points) & page.rect
+        if clip.is_empty:
+            continue
+        pix, crop = render(page, high_dpi, clip=clip)  # pix owns crop's buffer
+        region_lines = recognize(crop, lang)
+        if not region_lines:
+            continue
+
+        def inside(line):
+            if not line.get("bbox"):
+                return False
+            lx0, ly0, lx1, ly1 = bbox_rect(line["bbox"])
+            cx, cy = (lx0 + lx1) / 2, (ly0 + ly1) / 2
+            return x0 <= cx <= x1 and y0 <= cy <= y1
+
+        # The region OCR covers strong lines in the padded clip too; replace them all
+        lines = [l for l in lines if not inside(l)]
+        for rl in region_lines:
+            rl["bbox"] = transform_bbox(rl.get("bbox"), back, clip.x0 / to_points, clip.y0 / to_points)
+            rl["dpi"] = high_dpi
+            lines.append(rl)
+        escalated += 1
+    if escalated:
+        # Back to reading order (top, then left), as detect_line_boxes orders lines
+        lines.sort(key=lambda l: bbox_rect(l["bbox"])[1::-1] if l.get("bbox") else (float("inf"), float("inf")))
+    return lines, escalated
+
+def ocr_page(page, page_num, stem, outdir, dpi=300, text_layer=None, adaptive_dpi=None):
+    """
+    Returns the page entry of the output JSON: from the native text layer when
+    usable (text_layer="auto"), otherwise by rendering and OCRing the page.
+    With adaptive_dpi the page is OCR'd at OCR_LOW_DPI first and escalated to
+    `dpi` where confidence is low. The entry's "dpi" is the coordinate space of
+    its bboxes; "dpi_mode" records the decision.
+    """
+    adaptive = OCR_ADAPTIVE_DPI if adaptive_dpi is None else adaptive_dpi
+    use_text_layer = (text_layer or OCR_TEXT_LAYER) != "off"
+    if use_text_layer:
+        lines = native_text_lines(page, dpi=dpi)
+        if lines:
+            lang = detect_language_heuristic(" ".join(l["text"] for l in lines))
+            logging.info(f"Page {page_num+1}: native text layer ({len(lines)} lines), OCR skipped")
+            return {"page_number": page_num + 1, "lang": lang, "lines": lines, "source": "native",
+                    "dpi": dpi, "dpi_mode": "native"}
+
+    first_dpi = min(OCR_LOW_DPI, dpi) if adaptive else dpi
+    pix, image = render(page, first_dpi)
+    save_debug_image(image, outdir / f"{stem}_p{page_num+1}.png")
+
+    logging.info(f"Page {page_num+1}: OCR ({pix.width}x{pix.height} px @ {first_dpi} DPI)")
+
+    # Rough detect language (a too-sparse text layer still works as a probe)
+    native_text = page.get_text() if use_text_layer else ""
+    lang, probe = probe_language(image, native_text=native_text if text_layer_is_clean(native_text) else "")
+    logging.info(f"Heuristic language detection: {lang} ({probe['method']} probe, {probe['ms']:.0f} ms)")
+
+    lines = recognize(image, lang, debug_path=outdir / f"{stem}_p{page_num+1}_mlproc.png")
+    entry = {"page_number": page_num + 1, "lang": lang, "source": "ocr",
+             "dpi": first_dpi, "dpi_mode": "fixed"}
+
+    if adaptive and first_dpi < dpi:
+        known = [l for l in lines if line_confidence(l) is not None]
+        weak = sum(is_weak(l) for l in known)
+        entry["low_conf_lines"] = weak
+        if not lines or (known and weak / len(known) > OCR_ESCALATE_PAGE_FRACTION):
+            logging.info(f"Page {page_num+1}: {weak}/{len(known)} weak lines, re-rendering at {dpi} DPI")
+            pix, image = render(page, dpi)
+            lines = recognize(image, lang)
+            entry.update({"dpi": dpi, "dpi_mode": "page_escalated"})
+        elif weak:
+            lines, regions = escalate_regions(page, lines, lang, first_dpi, dpi)
+            entry.update({"dpi_mode": "regions_escalated", "escalated_regions": regions, "region_dpi": dpi})
+            logging.info(f"Page {page_num+1}: {regions} weak regions re-OCR'd at {dpi} DPI")
+        else:
+            entry["dpi_mode"] = "low"
+
+    entry["lines"] = lines
+    return entry
+
+# -------------------------------
+# Parallel page OCR (process pool)
+# -------------------------------
+# Workers are spawned, so each one imports this module and builds its own
+# OCR engines on first use; the pool is kept alive and reused across calls.
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", 1))
+OCR_WORKER_MEM_MB = int(os.getenv("OCR_WORKER_MEM_MB", 0))  # 0 = no cap
+OCR_PAGE_WINDOW = int(os.getenv("OCR_PAGE_WINDOW", 0))  # pages in flight; 0 = 2 x workers
+
+_ocr_pool = None
+_ocr_pool_config = None
+_RESUBMIT = object()  # iter_pages: pool task to send again after a pool restart
+_worker_doc = None
+
+def _init_ocr_worker(mem_limit_mb):
+    if mem_limit_mb:
+        try:
+            import resource
+        except ImportError:  # not available on Windows
+            logging.warning("OCR worker memory cap is not supported on this platform; ignoring it")
+            mem_limit_mb = 0
+        else:
+            limit = mem_limit_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    logging.info(f"OCR worker {os.getpid()} ready (memory cap: {mem_limit_mb or 'none'} MB)")
+
+def _ocr_page_task(pdf_path, page_num, outdir, dpi, text_layer, adaptive_dpi):
+    global _worker_doc
+    # Consecutive pages usually come from the same document; reopen only when it changes
+    if _worker_doc is None or _worker_doc.name != pdf_path:
+        _worker_doc = fitz.open(pdf_path)
+    try:
+        return ocr_page(_worker_doc[page_num], page_num, Path(pdf_path).stem, Path(outdir),
+                        dpi=dpi, text_layer=text_layer, adaptive_dpi=adaptive_dpi)
+    except MemoryError:
+        logging.warning(f"Page {page_num+1}: worker memory cap exceeded")
+        return {"page_number": page_num + 1, "lang": "unknown", "lines": [], "source": "ocr", "error": "memory_limit"}
+
+def get_ocr_pool(workers, mem_limit_mb=0):
+    global _ocr_pool, _ocr_pool_config
+    if _ocr_pool is None or _ocr_pool_config != (workers, mem_limit_mb):
+        if _ocr_pool is not None:
+            _ocr_pool.shutdown(wait=True)
+        _ocr_pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_ocr_worker,
+            initargs=(mem_limit_mb,)
+        )
+        _ocr_pool_config = (workers, mem_limit_mb)
+    return _ocr_pool
+
+def reset_ocr_pool():
+    """Drops a broken pool (a worker died) so the next get_ocr_pool builds a fresh one."""
+    global _ocr_pool, _ocr_pool_config
+    if _ocr_pool is not None:
+        try:
+            _ocr_pool.shutdown(wait=False, cancel_futures=True)
+        except Exception:
+            pass
+    _ocr_pool, _ocr_pool_config = None, None
+
+# -------------------------------
+# Result cache keys
+# -------------------------------
+# Bump when page output changes for the same file and options
+OCR_PIPELINE_VERSION = 1
+_engine_fingerprint = None
+
+def engine_fingerprint():
+    """Engine versions and OCR settings that page results depend on."""
+    global _engine_fingerprint
+    if _engine_fingerprint is None:
+        try:
+            tesseract_version = str(pytesseract.get_tesseract_version())
+        except Exception:
+            tesseract_version = None
+        _engine_fingerprint = {
+            "pipeline": OCR_PIPELINE_VERSION,
+            "pymupdf": package_version("PyMuPDF"),
+            "tesseract": tesseract_version,
+            "paddleocr": package_version("paddleocr"),
+            "transformers": package_version("transformers"),
+            "options": {
+                "lang_probe": lang_probe.OCR_LANG_PROBE,
+                "line_recognition": OCR_LINE_RECOGNITION,
+                "trocr_beams": TROCR_NUM_BEAMS,
+                "trocr_max_new_tokens": TROCR_MAX_NEW_TOKENS,
+                "low_dpi": OCR_LOW_DPI,
+                "conf_threshold": OCR_CONF_THRESHOLD,
+                "escalate_fraction": OCR_ESCALATE_PAGE_FRACTION,
+                "text_layer_min_chars": TEXT_LAYER_MIN_CHARS
+            }
+        }
+    return _engine_fingerprint
+
+def page_cache_key(content_hash, page_num, dpi, text_layer, adaptive_dpi):
+    return make_key("ocr_page", content_hash=content_hash, page=page_num + 1, dpi=dpi,
+                    text_layer=text_layer, adaptive_dpi=adaptive_dpi, engines=engine_fingerprint())
+
+def cached_tables(pdf_path, content_hash, max_pages):
+    key = make_key("tables", content_hash=content_hash, max_pages=max_pages, camelot=package_version("camelot-py"))
+    tables = result_cache.get(key) if content_hash else None
+    if tables is None:
+        tables = extract_tables(str(pdf_path), max_pages=max_pages)
+        if content_hash:
+            result_cache.set(key, "tables", content_hash, tables)
+    return tables
+
+# -------------------------------
+# Page stream
+# -------------------------------
+def iter_pages(pdf_path, page_nums, outdir, dpi=300, workers=1, worker_mem_mb=0, text_layer="auto",
+               adaptive_dpi=False, content_hash=None, doc=None, stats=None):
+    """
+    Generator of page entries in page order, each yielded as soon as it is
+    ready: cached pages immediately, the rest as the (pooled) OCR finishes
+    them, so downstream stages can start on page 1 while later pages run.
+    At most OCR_PAGE_WINDOW pages (cache lookups and pool tasks) are in flight
+    ahead of the consumer, so memory does not grow with the page count.
+    stats["pages_cached"] is filled in when provided.
+    """
+    pdf_path, outdir = Path(pdf_path), Path(outdir)
+    stats = stats if stats is not None else {}
+    stats["pages_cached"] = 0
+    pool = get_ocr_pool(workers, worker_mem_mb) if workers > 1 and len(page_nums) > 1 else None
+    if pool:
+        logging.info(f"OCR of up to {len(page_nums)} pages across {workers} workers")
+    else:
+        doc = doc if doc is not None else fitz.open(pdf_path)
+    window = OCR_PAGE_WINDOW or 2 * workers
+
+    def schedule(page_num):
+        key = page_cache_key(content_hash, page_num, dpi, text_layer, adaptive_dpi) if content_hash else None
+        hit = result_cache.get(key) if key else None
+        if hit is not None:
+            stats["pages_cached"] += 1
+            return page_num, key, hit, None
+        return page_num, key, None, submit(page_num)
+
+    def submit(page_num):
+        if pool is None:
+            return None
+        return pool.submit(_ocr_page_task, str(pdf_path), page_num, str(outdir), dpi, text_layer, adaptive_dpi)
+
+    pending, crashed = deque(), set()
+    upcoming = iter(page_nums)
+    for page_num in upcoming:
+        pending.append(schedule(page_num))
+        if len(pending) >= window:
+            break
+
+    while pending:
+        page_num, key, page_result, future = pending.popleft()
+        if future is _RESUBMIT:
+            # First page after a pool restart: put the rest of the window back in flight
+            future = submit(page_num)
+            for i, (n, k, r, f) in enumerate(pending):
+                if f is _RESUBMIT:
+                    pending[i] = (n, k, r, submit(n))
+        if page_result is None:
+            if future is not None:
+                try:
+                    page_result = future.result()
+                except BrokenProcessPool:
+                    # A worker died (e.g. a native segfault or abort under the memory cap)
+                    # and took every future of the pool with it. Rebuild the pool and
+                    # retry this page alone, so a second crash is surely its own; the
+                    # rest of the window is resubmitted after it.
+                    logging.warning(f"Page {page_num+1}: OCR worker crashed, restarting the pool")
+                    reset_ocr_pool()
+                    pool = get_ocr_pool(workers, worker_mem_mb)
+                    for i, (n, k, r, f) in enumerate(pending):
+                        if f is not None and f is not _RESUBMIT and not (
+                                f.done() and not f.cancelled() and f.exception() is None):
+                            pending[i] = (n, k, r, _RESUBMIT)
+                    if page_num in crashed:
+                        page_result = {"page_number": page_num + 1, "lang": "unknown", "lines": [],
+                                       "source": "ocr", "error": "worker_crashed"}
+                    else:
+                        crashed.add(page_num)
+                        pending.appendleft((page_num, key, None, submit(page_num)))
+                        continue
+            else:
+                page_result = ocr_page(doc[page_num], page_num, pdf_path.stem, outdir, dpi=dpi,
+                                       text_layer=text_layer, adaptive_dpi=adaptive_dpi)
+            if key and "error" not in page_result:
+                result_cache.set(key, "ocr_page", content_hash, page_result)
+        # Top the window up before handing the page downstream
+        next_page = next(upcoming, None)
+        if next_page is not None:
+            pending.append(schedule(next_page))
+        yield page_result
+
+    if stats["pages_cached"]:
+        logging.info(f"{stats['pages_cached']} page(s) served from the OCR cache")
+
 # -------------------------------
 # Main Processor
 # -------------------------------
-def process_pdf(pdf_path, outdir="outputs", max_pages=2, dpi=300):
+OCR_JSON_EXPORT = os.getenv("OCR_JSON_EXPORT", "false").lower() == "true"
+
+def process_pdf(pdf_path, outdir="outputs", max_pages=2, dpi=300, workers=None, worker_mem_mb=None,
+                text_layer=None, adaptive_dpi=None, content_hash=None, progress=None,
+                json_export=None, return_pages=True, stem=None):
+    """
+    OCRs the first max_pages pages of a PDF into outputs/<stem>.ocrp, a
+    page-indexed store written page by page (see page_store.py); the legacy
+    outputs/<stem>.json is only written with json_export (OCR_JSON_EXPORT).
+    workers > 1 fans pages out to a process pool; pages are reassembled in order.
+    text_layer="auto" (default, OCR_TEXT_LAYER) takes born-digital pages from the
+    PDF text layer instead of OCR; "off" OCRs every page.
+    adaptive_dpi (default OCR_ADAPTIVE_DPI) OCRs at OCR_LOW_DPI first and only
+    goes up to `dpi` for low-confidence pages or regions.
+    Pages and tables are cached by the file's SHA-256 (content_hash, computed
+    if not given), so only pages never seen with these options are OCR'd.
+    progress(page_entry, pages_done, pages_total) is called as each page is ready.
+    Returns file, metadata, tables and the output paths; "pages" is included
+    only with return_pages (callers streaming large documents pass False).
+    stem names the outputs (default: the PDF's stem); concurrent runs on the
+    same file must pass distinct stems.
+    """
+    text_layer = text_layer or OCR_TEXT_LAYER
+    adaptive_dpi = OCR_ADAPTIVE_DPI if adaptive_dpi is None else adaptive_dpi
+    json_export = OCR_JSON_EXPORT if json_export is None else json_export
     pdf_path = Path(pdf_path)
     outdir = Path(outdir)
     outdir.mkdir(parents=True, exist_ok=True)
+    workers = workers or OCR_WORKERS
+    worker_mem_mb = OCR_WORKER_MEM_MB if worker_mem_mb is None else worker_mem_mb
 
     logging.info(f"Processing file: {pdf_path}")
     doc = fitz.open(pdf_path)
+    if content_hash is None and result_cache.enabled:
+        content_hash = sha256_file(pdf_path)
 
-    result_json = {
-        "file": str(pdf_path),
-        "metadata": {"pages": len(doc)},
-        "pages": [],
-        "tables": []
-    }
+    metadata = {"file": str(pdf_path), "pages": len(doc), "content_hash": content_hash}
+    stem = stem or pdf_path.stem
+    store_path = outdir / f"{stem}.ocrp"
+    pages = [] if return_pages else None
+    native = done = 0
+    dpi_modes = {}
 
-    # Tables
-    tables = extract_tables(str(pdf_path), max_pages=max_pages)
-    result_json["tables"] = tables
-
-    for page_num in range(min(max_pages, len(doc))):
-        page = doc[page_num]
-        pix = page.get_pixmap(dpi=dpi)
-        img_path = outdir / f"{pdf_path.stem}_p{page_num+1}.png"
-        pix.save(img_path)
-
-        logging.info(f"Page {page_num+1}: OCR {img_path}")
-
-        # Rough detect language
-        rough_text = pytesseract.image_to_string(Image.open(img_path), config="--psm 6", lang="eng+mal")
-        lang = detect_language_heuristic(rough_text)
-        logging.info(f"Heuristic language detection: {lang}")
-
-        lines = None
-        if lang == "ml":
-            preproc_img = preprocess_for_malayalam(img_path)
-            lines = run_indicocr(preproc_img) or run_tesseract(preproc_img, lang="mal")
-        elif lang == "hybrid":
-            lines = run_paddle(str(img_path)) or run_tesseract(str(img_path), lang="eng")
-        else:  # English
-            lines = run_paddle(str(img_path)) or run_tesseract(str(img_path), lang="eng")
-
-        if not lines:
-            lines = run_trocr(str(img_path))
-
-        result_json["pages"].append({
-            "page_number": page_num + 1,
-            "lang": lang,
-            "lines": lines if lines else []
+    page_nums = range(min(max_pages, len(doc)))
+    stats = {}
+    with PageStoreWriter(store_path) as store:
+        for page_result in iter_pages(pdf_path, page_nums, outdir, dpi=dpi, workers=workers,
+                                      worker_mem_mb=worker_mem_mb, text_layer=text_layer,
+                                      adaptive_dpi=adaptive_dpi, content_hash=content_hash, doc=doc, stats=stats):
+            store.write_page(page_result)
+            done += 1
+            native += page_result.get("source") == "native"
+            mode = page_result.get("dpi_mode", "fixed")
+            dpi_modes[mode] = dpi_modes.get(mode, 0) + 1
+            if pages is not None:
+                pages.append(page_result)
+            if progress:
+                progress(page_result, done, len(page_nums))
+
+        # Tables (after the pages, so page consumers are not held up by camelot)
+        tables = cached_tables(pdf_path, content_hash, max_pages)
+        store.write_tables(tables)
+
+        metadata.update({
+            "pages_cached": stats.get("pages_cached", 0),
+            "pages_native": native,
+            "pages_ocr": done - native,
+            "dpi_modes": dpi_modes
         })
+        store.close({**metadata, "pages_processed": done})
+    logging.info(f"Saved OCR page store → {store_path}")
 
-    # Save JSON
-    out_path = outdir / f"{pdf_path.stem}.json"
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(result_json, f, ensure_ascii=False, indent=2)
+    result_json = {
+        "file": str(pdf_path),
+        "metadata": {k: v for k, v in metadata.items() if k != "file"},
+        "tables": tables,
+        "store_path": str(store_path),
+        "json_path": None
+    }
+    if pages is not None:
+        result_json["pages"] = pages
 
-    logging.info(f"Saved processed JSON → {out_path}")
+    if json_export:
+        from_store = PageStore(store_path) if pages is None else None
+        out_path = outdir / f"{stem}.json"
+        if from_store:
+            with from_store:
+                from_store.export_json(out_path)
+        else:
+            with open(out_path, "w", encoding="utf-8") as f:
+                json.dump({"file": result_json["file"], "metadata": result_json["metadata"],
+                           "pages": pages, "tables": tables}, f, ensure_ascii=False, indent=2)
+        result_json["json_path"] = str(out_path)
+        logging.info(f"Saved processed JSON → {out_path}")
     return result_json
 
 # -------------------------------
 # CLI
 # -------------------------------
 def main(args):
-    process_pdf(args.file, outdir=args.outdir, max_pages=args.max_pages, dpi=args.dpi)
+    global OCR_DEBUG_IMAGES
+    if args.debug_images:
+        OCR_DEBUG_IMAGES = True
+        os.environ["OCR_DEBUG_IMAGES"] = "true"  # spawned OCR workers read it at import
+    process_pdf(args.file, outdir=args.outdir, max_pages=args.max_pages, dpi=args.dpi,
+                workers=args.workers, worker_mem_mb=args.worker_mem_mb, text_layer=args.text_layer,
+                adaptive_dpi=args.adaptive_dpi or None, json_export=args.json or None)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -241,5 +817,11 @@ if __name__ == "__main__":
     parser.add_argument("--outdir", default="outputs", help="output folder for processed JSON")
     parser.add_argument("--max-pages", type=int, default=3, help="max pages to process")
     parser.add_argument("--dpi", type=int, default=300, help="DPI for PDF->image conversion")
+    parser.add_argument("--workers", type=int, default=None, help="parallel OCR worker processes")
+    parser.add_argument("--worker-mem-mb", type=int, default=None, help="address-space cap per OCR worker (MB)")
+    parser.add_argument("--text-layer", choices=["auto", "off"], default=None, help="use native PDF text when usable")
+    parser.add_argument("--adaptive-dpi", action="store_true", help="OCR at low DPI first, escalate weak pages/regions to --dpi")
+    parser.add_argument("--json", action="store_true", help="also export the legacy <stem>.json")
+    parser.add_argument("--debug-images", action="store_true", help="also write page / preprocessed PNGs to outdir")
     args = parser.parse_args()
     main(args)
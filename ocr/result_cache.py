@@ -0,0 +1,124 @@
+# result_cache.py
+import os
+import json
+import time
+import sqlite3
+import hashlib
+from contextlib import closing
+from importlib import metadata
+
+# -------------------------------
+# Content-hash keyed OCR / summary cache
+# -------------------------------
+# Uploads are identified by the SHA-256 of their bytes, so re-uploading the same
+# PDF (under any name) reuses earlier work:
+#   - OCR pages per (content hash, page, dpi, OCR options, engine fingerprint)
+#   - tables per (content hash, page range)
+#   - summaries per (content hash, summarized text, summarizer config)
+#   - chunk summaries per (chunk text, generation settings), shared by all documents
+# Entries live in a local SQLite file shared by API workers and OCR processes.
+OCR_CACHE_ENABLED = os.getenv("OCR_CACHE_ENABLED", "true").lower() == "true"
+OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH", "cache/ocr_cache.sqlite3")
+HASH_BLOCK_SIZE = 1024 * 1024
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def copy_and_hash(src, dst):
+    """Streams a file object to `dst` (binary), hashing as it goes. Returns (sha256, bytes)."""
+    digest = hashlib.sha256()
+    size = 0
+    for block in iter(lambda: src.read(HASH_BLOCK_SIZE), b""):
+        digest.update(block)
+        dst.write(block)
+        size += len(block)
+    return digest.hexdigest(), size
+
+def package_version(name):
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return None
+
+def make_key(kind, **parts):
+    payload = json.dumps({"kind": kind, **parts}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResultCache:
+    def __init__(self, path, enabled=True):
+        self.path = path
+        self.enabled = enabled
+        if not enabled:
+            return
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with closing(self._connect()) as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS results_content_hash ON results (content_hash)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10, isolation_level=None)
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with closing(self._connect()) as db:
+            row = db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE results SET hits = hits + 1 WHERE key = ?", (key,))
+            return json.loads(row[0])
+
+    def get_many(self, keys):
+        """Returns {key: value} for the keys present."""
+        if not self.enabled or not keys:
+            return {}
+        keys, found = list(keys), {}
+        with closing(self._connect()) as db:
+            # older SQLite builds allow at most 999 bound parameters per statement
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                marks = ",".join("?" * len(batch))
+                rows = db.execute(f"SELECT key, value FROM results WHERE key IN ({marks})", batch).fetchall()
+                db.execute(f"UPDATE results SET hits = hits + 1 WHERE key IN ({marks})", batch)
+                found.update((k, json.loads(v)) for k, v in rows)
+        return found
+
+    def set(self, key, kind, content_hash, value):
+        if not self.enabled:
+            return
+        with closing(self._connect()) as db:
+            db.execute(
+                "INSERT OR REPLACE INTO results (key, kind, content_hash, value, created_at) VALUES (?, ?, ?, ?, ?)",
+                (key, kind, content_hash, json.dumps(value, ensure_ascii=False, default=str), time.time())
+            )
+
+    def stats(self):
+        if not self.enabled:
+            return {"enabled": False}
+        with closing(self._connect()) as db:
+            by_kind = db.execute("SELECT kind, COUNT(*), COALESCE(SUM(hits), 0) FROM results GROUP BY kind").fetchall()
+            return {
+                "enabled": True,
+                # summary_chunk entries are keyed by chunk text alone and shared across documents
+                "documents": db.execute(
+                    "SELECT COUNT(DISTINCT content_hash) FROM results WHERE kind != 'summary_chunk'"
+                ).fetchone()[0],
+                "entries": {kind: {"count": n, "hits": hits} for kind, n, hits in by_kind}
+            }
+
+result_cache = ResultCache(OCR_CACHE_PATH, enabled=OCR_CACHE_ENABLED)
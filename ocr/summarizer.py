@@ -1,27 +1,57 @@
 # summarizer.py
 import os
+import sys
+import math
 import argparse
 import json
+import hashlib
+import uuid
 from collections import Counter
-from wordcloud import WordCloud
-import matplotlib.pyplot as plt
-from transformers import pipeline
+import re
+
+try:
+    from ocr.result_cache import result_cache, make_key, package_version
+    from ocr.page_store import iter_ocr_pages, read_ocr_metadata
+except ImportError:  # run as a script from inside ocr/
+    from result_cache import result_cache, make_key, package_version
+    from page_store import iter_ocr_pages, read_ocr_metadata
 
 # -------------------------------
 # Init summarizer
 # -------------------------------
-summarizer = pipeline("summarization", model="facebook/bart-large-cnn")
+# Everything that changes the summary text is in SUMMARY_CONFIG (and so in the
+# cache keys); batch size only affects speed.
+SUMMARY_CONFIG = {
+    "model": "facebook/bart-large-cnn",
+    "chunk_tokens": 900,        # BART reads at most 1024 tokens
+    "min_chunk_tokens": 400,    # below this a chunk never closes at a boundary sentence
+    "max_length": 150,          # per-chunk summary
+    "min_length": 40,
+    "min_length_fraction": 0.5, # min_length never exceeds this share of the input tokens
+    "final_max_length": 250,    # map_reduce output
+    "final_min_length": 80,
+    "strategy": os.getenv("SUMMARY_STRATEGY", "map_reduce")   # or "concat"
+}
+SUMMARY_BATCH_SIZE = int(os.getenv("SUMMARY_BATCH_SIZE", 4))
+MAX_REDUCE_LEVELS = 4
+
+_summarizer = None
+
+def get_summarizer():
+    """BART is loaded on first use, not at import."""
+    global _summarizer
+    if _summarizer is None:
+        from transformers import pipeline
+        _summarizer = pipeline("summarization", model=SUMMARY_CONFIG["model"])
+    return _summarizer
 
 # -------------------------------
 # Functions
 # -------------------------------
 def load_text_with_meta(json_path):
-    """Extract all lines of text with page/line references."""
-    with open(json_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
+    """Extract all lines of text with page/line references (from an .ocrp store or OCR JSON)."""
     lines = []
-    for page in data.get("pages", []):
+    for page in iter_ocr_pages(json_path):
         for idx, line in enumerate(page.get("lines", [])):
             if "text" in line and line["text"].strip():
                 lines.append({
@@ -31,67 +61,357 @@ def load_text_with_meta(json_path):
                 })
     return lines
 
-def make_summary(full_text):
+# -------------------------------
+# Token-aware chunking
+# -------------------------------
+_sentence_split = re.compile(r"(?<=[.!?;])\s+")
+
+def split_sentences(text):
+    return [s for s in _sentence_split.split(" ".join(text.split())) if s]
+
+def _is_boundary(sentence):
+    # Content-defined boundary: chunk edges depend only on nearby sentences, so
+    # an edit re-chunks (and re-summarizes) its own section, not everything after it
+    return hashlib.md5(sentence.encode("utf-8")).digest()[0] % 4 == 0
+
+def chunk_by_tokens(text, tokenizer, max_tokens=None, min_tokens=None):
+    """Sentence-aligned chunks of at most max_tokens tokens (over-long sentences are split)."""
+    max_tokens = max_tokens or SUMMARY_CONFIG["chunk_tokens"]
+    min_tokens = min_tokens or SUMMARY_CONFIG["min_chunk_tokens"]
+    sentences = split_sentences(text)
+    if not sentences:
+        return []
+    lengths = [len(ids) for ids in tokenizer(sentences, add_special_tokens=False)["input_ids"]]
+
+    chunks, current, used = [], [], 0
+    for sent, n in zip(sentences, lengths):
+        pieces = [(sent, n)]
+        if n > max_tokens:
+            ids = tokenizer(sent, add_special_tokens=False)["input_ids"]
+            pieces = [(tokenizer.decode(ids[i:i + max_tokens]), len(ids[i:i + max_tokens]))
+                      for i in range(0, len(ids), max_tokens)]
+        for piece, m in pieces:
+            if current and used + m > max_tokens:
+                chunks.append(" ".join(current))
+                current, used = [], 0
+            current.append(piece)
+            used += m
+            if used >= min_tokens and _is_boundary(piece):
+                chunks.append(" ".join(current))
+                current, used = [], 0
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+# -------------------------------
+# Summarization (map / reduce)
+# -------------------------------
+def summarize_chunks(chunks, max_length=None, min_length=None, batch_size=None):
+    """
+    Summarizes each chunk, reusing per-chunk summaries cached under the chunk
+    text and generation settings; only new or edited chunks reach BART.
+    """
+    max_length = max_length or SUMMARY_CONFIG["max_length"]
+    min_length = min_length or SUMMARY_CONFIG["min_length"]
+    keys = [make_key("summary_chunk", model=SUMMARY_CONFIG["model"], max_length=max_length,
+                     min_length=min_length, min_length_fraction=SUMMARY_CONFIG["min_length_fraction"], text=hashlib.sha256(c.encode("utf-8")).hexdigest())
+            for c in chunks]
+    cached = result_cache.get_many(keys)
+    todo = [i for i, k in enumerate(keys) if k not in cached]
+
+    if todo:
+        summarizer = get_summarizer()
+        # A summary forced longer than its input gets padded with repeated or
+        # invented text: cap min_length at a fraction of each chunk's tokens
+        lengths = [len(ids) for ids in summarizer.tokenizer([chunks[i] for i in todo], add_special_tokens=False)["input_ids"]]
+        groups = {}
+        for i, n in zip(todo, lengths):
+            floor = max(1, min(min_length, max_length - 1, int(n * SUMMARY_CONFIG["min_length_fraction"])))
+            groups.setdefault(floor, []).append(i)
+        for floor, indices in groups.items():
+            outputs = summarizer(
+                [chunks[i] for i in indices],
+                max_length=max_length,
+                min_length=floor,
+                do_sample=False,
+                truncation=True,
+                batch_size=batch_size or SUMMARY_BATCH_SIZE
+            )
+            for i, o in zip(indices, outputs):
+                cached[keys[i]] = o["summary_text"]
+                result_cache.set(keys[i], "summary_chunk", "-", o["summary_text"])
+    return [cached[k] for k in keys], len(chunks) - len(todo)
+
+def make_summary(full_text, strategy=None, stats=None):
+    """
+    strategy="map_reduce": summarize sentence-aligned token chunks, then keep
+    summarizing the joined summaries until they fit one chunk, and produce a
+    final summary of at most final_max_length tokens.
+    strategy="concat": the chunk summaries joined (the older output shape).
+    """
     if not full_text.strip():
         return "No text available for summarization."
-    # Summarize in chunks (BART has max length ~1024 tokens)
-    inputs = [full_text[i:i+1000] for i in range(0, len(full_text), 1000)]
-    outputs = summarizer(inputs, max_length=150, min_length=40, do_sample=False)
-    return " ".join([o['summary_text'] for o in outputs])
-
-def make_word_stats(lines, top_k=10):
-    # Flatten text
-    words = " ".join([l["text"] for l in lines]).lower().split()
-    counts = Counter(words)
-    # Top K words
-    top_words = counts.most_common(top_k)
-
-    # Map back to pages/lines
+    strategy = strategy or SUMMARY_CONFIG["strategy"]
+    tokenizer = get_summarizer().tokenizer
+    stats = stats if stats is not None else {}
+
+    chunks = chunk_by_tokens(full_text, tokenizer)
+    summaries, reused = summarize_chunks(chunks)
+    stats.update({"chunks": len(chunks), "chunks_reused": reused, "levels": 1})
+    if strategy == "concat":
+        return " ".join(summaries)
+
+    text = " ".join(summaries)
+    while stats["levels"] < MAX_REDUCE_LEVELS and len(tokenizer(text, add_special_tokens=False)["input_ids"]) > SUMMARY_CONFIG["chunk_tokens"]:
+        summaries, _ = summarize_chunks(chunk_by_tokens(text, tokenizer))
+        text = " ".join(summaries)
+        stats["levels"] += 1
+    if len(chunks) == 1 and stats["levels"] == 1:
+        return text
+    final, _ = summarize_chunks([text], max_length=SUMMARY_CONFIG["final_max_length"],
+                                min_length=SUMMARY_CONFIG["final_min_length"])
+    stats["levels"] += 1
+    return final[0]
+
+# -------------------------------
+# Extractive summarization (MMR)
+# -------------------------------
+# No generation: pick the sentences closest to the document centroid, with an
+# MMR penalty for repeating already-picked ones. Sentences are scored with
+# TF-IDF vectors (pure Python, well under a second for ~100 pages);
+# when the API has the e5 encoder loaded (app.models.embeddings), the top
+# candidates are re-ranked with it. The encoder never sees the whole document,
+# so its cost is bounded by EXTRACTIVE_CONFIG["candidates"].
+EXTRACTIVE_CONFIG = {
+    "sentences": 8,          # sentences in the summary
+    "candidates": 48,        # top TF-IDF sentences re-ranked by the encoder
+    "diversity": 0.3,        # MMR: 0 = pure centrality, 1 = pure novelty
+    "min_words": 6,          # shorter sentences (headers, numbering) are skipped
+    "max_words": 80,         # longer "sentences" are usually unpunctuated OCR runs
+    "encoder": os.getenv("SUMMARY_EXTRACTIVE_ENCODER", "auto")   # "auto" | "model" | "tfidf"
+}
+_word = re.compile(r"[^\W\d_]{3,}")
+
+def sentences_with_refs(lines):
+    """Sentences spanning OCR lines, each with the page/line where it starts."""
+    sentences, parts, start = [], [], None
+    for l in lines:
+        pieces = _sentence_split.split(l["text"])
+        for i, piece in enumerate(pieces):
+            if not piece:
+                continue
+            if start is None:
+                start = (l["page_number"], l["line_number"])
+            parts.append(piece)
+            if i < len(pieces) - 1 or piece.endswith((".", "!", "?", ";")):
+                sentences.append({"text": " ".join(parts), "page": start[0], "line": start[1]})
+                parts, start = [], None
+    if parts:
+        sentences.append({"text": " ".join(parts), "page": start[0], "line": start[1]})
+    return sentences
+
+def _tfidf_vectors(texts):
+    """L2-normalised sparse {term: weight} vectors."""
+    tfs = [Counter(_word.findall(t.lower())) for t in texts]
+    df = Counter(term for tf in tfs for term in tf)
+    n = len(texts)
+    vectors = []
+    for tf in tfs:
+        vec = {term: c * (math.log((1 + n) / (1 + df[term])) + 1) for term, c in tf.items()}
+        norm = math.sqrt(sum(w * w for w in vec.values())) or 1.0
+        vectors.append({term: w / norm for term, w in vec.items()})
+    return vectors
+
+def _sparse_dot(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(w * b.get(term, 0.0) for term, w in a.items())
+
+def _mmr(relevance, similarity, k, diversity):
+    """Indices picked greedily by (1 - diversity) * relevance - diversity * redundancy."""
+    picked, redundancy = [], [0.0] * len(relevance)
+    remaining = set(range(len(relevance)))
+    while remaining and len(picked) < k:
+        best = max(remaining, key=lambda i: (1 - diversity) * relevance[i] - diversity * redundancy[i])
+        picked.append(best)
+        remaining.discard(best)
+        for i in remaining:
+            redundancy[i] = max(redundancy[i], similarity(i, best))
+    return picked
+
+def _loaded_encoder(encoder):
+    """The app's sentence encoder, if requested or (for "auto") already imported."""
+    if encoder == "tfidf" or (encoder == "auto" and "app.models.embeddings" not in sys.modules):
+        return None
+    try:
+        from app.models.embeddings import model
+    except ImportError:
+        return None
+    return model
+
+def make_extractive_summary(lines, k=None, stats=None):
+    """Returns (summary text, [{text, page, line, score}]) in document order."""
+    k = k or EXTRACTIVE_CONFIG["sentences"]
+    stats = stats if stats is not None else {}
+    sentences = [s for s in sentences_with_refs(lines)
+                 if EXTRACTIVE_CONFIG["min_words"] <= len(s["text"].split()) <= EXTRACTIVE_CONFIG["max_words"]]
+    stats.update({"sentences": len(sentences), "encoder": "tfidf"})
+    if not sentences:
+        return "No text available for summarization.", []
+
+    vectors = _tfidf_vectors([s["text"] for s in sentences])
+    centroid = Counter()
+    for vec in vectors:
+        centroid.update(vec)
+    relevance = [_sparse_dot(vec, centroid) for vec in vectors]
+    top = max(relevance) or 1.0
+    relevance = [r / top for r in relevance]
+
+    encoder = _loaded_encoder(EXTRACTIVE_CONFIG["encoder"])
+    if encoder is not None:
+        candidates = sorted(range(len(sentences)), key=relevance.__getitem__, reverse=True)[:EXTRACTIVE_CONFIG["candidates"]]
+        emb = encoder.encode([sentences[i]["text"] for i in candidates], normalize_embeddings=True,
+                             show_progress_bar=False)
+        center = emb.mean(axis=0)
+        scores = (emb @ center).tolist()
+        sims = (emb @ emb.T).tolist()
+        picked = [candidates[j] for j in _mmr(scores, lambda a, b: sims[a][b], k, EXTRACTIVE_CONFIG["diversity"])]
+        relevance = dict(zip(candidates, scores))
+        stats["encoder"] = "model"
+    else:
+        picked = _mmr(relevance, lambda a, b: _sparse_dot(vectors[a], vectors[b]), k, EXTRACTIVE_CONFIG["diversity"])
+
+    chosen = [{**sentences[i], "score": round(float(relevance[i]), 4)} for i in sorted(picked)]
+    return " ".join(s["text"] for s in chosen), chosen
+
+# -------------------------------
+# Word statistics (inverted index)
+# -------------------------------
+# One tokenizing pass builds word -> postings (indices into `lines`); counts,
+# top-k and occurrences all come from it. Whole tokens only, so "act" does not
+# match inside "contract".
+_token = re.compile(r"[^\W_]+(?:['’-][^\W_]+)*")
+WORDCLOUD_CACHE_DIR = os.getenv("WORDCLOUD_CACHE_DIR", "cache/wordclouds")
+
+def build_word_index(lines):
+    """Returns (Counter of word frequencies, {word: [line indices]})."""
+    counts, postings = Counter(), {}
+    for i, l in enumerate(lines):
+        tokens = _token.findall(l["text"].lower())
+        counts.update(tokens)
+        for word in set(tokens):
+            postings.setdefault(word, []).append(i)
+    return counts, postings
+
+def make_word_stats(lines, top_k=10, index=None):
+    counts, postings = index or build_word_index(lines)
     word_refs = {}
-    for word, count in top_words:
-        refs = []
-        for l in lines:
-            if word in l["text"].lower():
-                refs.append({
-                    "page": l["page_number"],
-                    "line": l["line_number"],
-                    "context": l["text"]
-                })
+    for word, count in counts.most_common(top_k):
         word_refs[word] = {
             "count": count,
-            "occurrences": refs
+            "occurrences": [{
+                "page": lines[i]["page_number"],
+                "line": lines[i]["line_number"],
+                "context": lines[i]["text"]
+            } for i in postings[word]]
         }
     return word_refs
 
-def make_wordcloud(lines, outdir, fname="wordcloud.png"):
-    text = " ".join([l["text"] for l in lines])
-    wc = WordCloud(width=1200, height=800, background_color="white").generate(text)
-    out_path = os.path.join(outdir, fname)
-    wc.to_file(out_path)
+def make_wordcloud(counts, out_path):
+    """Renders word frequencies (stopwords and numbers dropped) to a PNG."""
+    from wordcloud import WordCloud, STOPWORDS
+
+    freqs = {w: c for w, c in counts.items() if w not in STOPWORDS and not w.isdigit()}
+    wc = WordCloud(width=1200, height=800, background_color="white")
+    wc.generate_from_frequencies(freqs or {"(empty)": 1})
+    if os.path.dirname(out_path):
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    # Unique temp name: concurrent first requests each render, the last rename wins
+    tmp_path = f"{os.path.splitext(out_path)[0]}.{uuid.uuid4().hex}.tmp.png"
+    try:
+        wc.to_file(tmp_path)
+        os.replace(tmp_path, out_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return out_path
+
+def cached_wordcloud(json_path, content_hash=None, ocr_params=None):
+    """
+    Word cloud PNG for an OCR output, rendered on first request and kept under
+    WORDCLOUD_CACHE_DIR/<key>.png. The key is the document's content hash plus
+    the OCR options that shaped its text (max_pages, dpi, text_layer,
+    adaptive_dpi) when the caller has them, else the OCR file's path, size and
+    mtime; the text itself is only read on a miss.
+    """
+    if content_hash and ocr_params is not None:
+        source = {"content_hash": content_hash, "ocr": ocr_params}
+    else:
+        st = os.stat(json_path)
+        source = {"path": os.path.abspath(json_path), "size": st.st_size, "mtime": st.st_mtime_ns}
+    key = make_key("wordcloud", source=source, word_token=_token.pattern,
+                   wordcloud=package_version("wordcloud"))
+    out_path = os.path.join(WORDCLOUD_CACHE_DIR, f"{key}.png")
+    if not os.path.exists(out_path):
+        counts, _ = build_word_index(load_text_with_meta(json_path))
+        make_wordcloud(counts, out_path)
     return out_path
 
-def run(json_path, outdir="outputs", top_k=10):
+def summary_cache_key(content_hash, full_text, top_k, strategy, mode="abstractive"):
+    """Same document, same extracted text, same summarizer settings -> same result."""
+    config = {**SUMMARY_CONFIG, "strategy": strategy} if mode == "abstractive" else EXTRACTIVE_CONFIG
+    return make_key("summary", content_hash=content_hash,
+                    text=hashlib.sha256(full_text.encode("utf-8")).hexdigest(),
+                    mode=mode, config=config, top_k=top_k, word_token=_token.pattern,
+                    transformers=package_version("transformers"))
+
+def run(json_path, outdir="outputs", top_k=10, content_hash=None, strategy=None, mode="abstractive"):
+    """
+    mode="abstractive" (default): BART map/reduce summary (see make_summary).
+    mode="extractive": representative sentences with page/line references
+    (see make_extractive_summary); much faster on CPU.
+    """
     os.makedirs(outdir, exist_ok=True)
     lines = load_text_with_meta(json_path)
     full_text = " ".join([l["text"] for l in lines])
 
-    summary = make_summary(full_text)
-    word_stats = make_word_stats(lines, top_k=top_k)
-    wc_path = make_wordcloud(lines, outdir)
+    if content_hash is None:
+        content_hash = read_ocr_metadata(json_path).get("content_hash")
+    strategy = strategy or SUMMARY_CONFIG["strategy"]
+    key = summary_cache_key(content_hash, full_text, top_k, strategy, mode) if content_hash else None
+    cached = result_cache.get(key) if key else None
+
+    summary_stats, summary_sentences = {}, None
+    if cached:
+        summary, word_stats = cached["summary"], cached["top_words"]
+        summary_sentences = cached.get("summary_sentences")
+        print("✅ Summary served from cache")
+    else:
+        if mode == "extractive":
+            summary, summary_sentences = make_extractive_summary(lines, stats=summary_stats)
+        else:
+            summary = make_summary(full_text, strategy=strategy, stats=summary_stats)
+        word_stats = make_word_stats(lines, top_k=top_k, index=build_word_index(lines))
+        if key:
+            result_cache.set(key, "summary", content_hash, {"summary": summary, "top_words": word_stats,
+                                                            "summary_sentences": summary_sentences})
 
     result = {
         "source_json": json_path,
         "summary": summary,
+        "summary_sentences": summary_sentences,
         "top_words": word_stats,
-        "wordcloud_image": wc_path
+        "mode": mode,
+        "strategy": strategy if mode == "abstractive" else None,
+        "summary_stats": summary_stats,
+        "cached": bool(cached)
     }
 
-    out_path = os.path.join(outdir, os.path.basename(json_path).replace(".json", "_sum.json"))
+    out_path = os.path.join(outdir, os.path.splitext(os.path.basename(json_path))[0] + "_sum.json")
     with open(out_path, "w", encoding="utf-8") as f:
         json.dump(result, f, ensure_ascii=False, indent=2)
 
     print(f"✅ Saved summarization JSON → {out_path}")
-    print(f"✅ Wordcloud saved → {wc_path}")
     return result
 
 # -------------------------------
@@ -99,9 +419,16 @@ def run(json_path, outdir="outputs", top_k=10):
 # -------------------------------
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--json", required=True, help="Path to OCR JSON file")
+    parser.add_argument("--json", required=True, help="Path to OCR output (.ocrp store or JSON file)")
     parser.add_argument("--outdir", default="outputs", help="Folder for results")
     parser.add_argument("--top-k", type=int, default=10, help="Top K frequent words")
+    parser.add_argument("--strategy", choices=["map_reduce", "concat"], default=None, help="how chunk summaries are combined")
+    parser.add_argument("--mode", choices=["abstractive", "extractive"], default="abstractive",
+                        help="BART summary, or representative sentences with page/line refs")
+    parser.add_argument("--wordcloud", action="store_true", help="also render the word cloud PNG")
     args = parser.parse_args()
 
-    run(args.json, outdir=args.outdir, top_k=args.top_k)
+    run(args.json, outdir=args.outdir, top_k=args.top_k, strategy=args.strategy, mode=args.mode)
+    if args.wordcloud:
+        counts, _ = build_word_index(load_text_with_meta(args.json))
+        print(f"✅ Wordcloud saved → {make_wordcloud(counts, os.path.join(args.outdir, 'wordcloud.png'))}")
@@ -4,31 +4,24 @@ import argparse
 import logging
 import fitz  # PyMuPDF
 from pathlib import Path
-from paddleocr import PaddleOCR
 import pytesseract
-from transformers import TrOCRProcessor, VisionEncoderDecoderModel
 from PIL import Image
-import camelot
 import json
 import cv2
 import numpy as np
 
+try:
+    from ocr.engines import registry as engines
+except ImportError:  # run as a script from inside ocr/
+    from engines import registry as engines
+
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 # -------------------------------
-# OCR Engines
+# OCR Engines (shared lazy registry, see engines.py)
 # -------------------------------
-paddle_en = None
-try:
-    paddle_en = PaddleOCR(lang="en", det=True, rec=True, cls=True)
-except Exception as e:
-    logging.warning(f"PaddleOCR not fully available: {e}")
-
 tess_config = "--psm 6"
 
-processor = TrOCRProcessor.from_pretrained("microsoft/trocr-base-printed")
-trocr_model = VisionEncoderDecoderModel.from_pretrained("microsoft/trocr-base-printed")
-
 # -------------------------------
 # Language Heuristic
 # -------------------------------
@@ -69,6 +62,7 @@ def preprocess_for_malayalam(image_path):
 # OCR Runners
 # -------------------------------
 def run_paddle(image_path):
+    paddle_en = engines.get("paddle_en")
     if not paddle_en:
         return None
     try:
@@ -103,6 +97,10 @@ def run_tesseract(image_path, lang="eng"):
         return None
 
 def run_trocr(image_path):
+    trocr = engines.get("trocr")
+    if not trocr:
+        return None
+    processor, trocr_model = trocr
     try:
         image = Image.open(image_path).convert("RGB")
         pixel_values = processor(images=image, return_tensors="pt").pixel_values
@@ -120,6 +118,7 @@ def run_trocr(image_path):
 
 def extract_tables(pdf_path, max_pages=3):
     try:
+        import camelot
         tables = camelot.read_pdf(pdf_path, pages=f"1-{max_pages}", flavor="lattice")
         extracted = []
         for i, table in enumerate(tables):